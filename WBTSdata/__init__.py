@@ -0,0 +1,6 @@
+def __getattr__(name):
+    ### import the pipeline only when build_archive is used, so that importing a single module stays fast
+    if name == 'build_archive':
+        from WBTSdata.pipeline import build_archive
+        return build_archive
+    raise AttributeError(f"module 'WBTSdata' has no attribute '{name}'")
@@ -0,0 +1,218 @@
+import os
+import json
+
+### directories of the raw archive which are not searched for cruises
+excluded_CTD = ['Created_files']
+### the 2019_12 ADCP directory is empty
+excluded_ADCP = ['2019_12']
+ADCP_dir_names = ['ladcp_velfiles', 'LADCP_velfiles']
+
+
+def scan_directory(path, dirs, previous=None):
+    '''
+    Record a directory and all its sub-directories in dirs.
+
+    Directories whose modification time did not change since the previous scan are not listed again,
+    only their sub-directories are checked.
+
+    Parameters
+    ----------
+    path : str
+        The path to the directory
+    dirs : dict
+        The dictionary the records are added to, with the path as key
+    previous : dict(optional)
+        The records of an earlier scan
+    '''
+    mtime = os.stat(path).st_mtime_ns
+    record = (previous or {}).get(path)
+    if record is None or record['mtime'] != mtime:
+        record = {'mtime': mtime, 'subdirs': [], 'symlinks': [], 'n_cal': 0, 'n_vel': 0}
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    ### like os.walk, symbolic links to directories are listed but not followed
+                    record['symlinks' if entry.is_symlink() else 'subdirs'].append(entry.name)
+                elif entry.name.endswith('.cal'):
+                    record['n_cal'] += 1
+                elif entry.name.endswith('.vel'):
+                    record['n_vel'] += 1
+    dirs[path] = record
+    for name in record['subdirs']:
+        scan_directory(os.path.join(path, name), dirs, previous)
+
+def find_data_dirs(dirs):
+    '''
+    Find the CTD and ADCP directories in the records of a scan.
+
+    Parameters
+    ----------
+    dirs : dict
+        The records of the directories as created by scan_directory
+
+    Returns
+    -------
+    ctd_dirs : list
+        The sorted paths to the directories containing CTD data
+    adcp_dirs : list
+        The sorted paths to the directories containing ADCP data
+    '''
+    ctd_dirs = []
+    adcp_dirs = []
+    for path, record in dirs.items():
+        names = record['subdirs'] + record['symlinks']
+        if 'CTD' in names:
+            ctd_dirs.append(os.path.join(path, 'CTD'))
+        for name in ADCP_dir_names:
+            if name in names:
+                adcp_dirs.append(os.path.join(path, name))
+    ctd_dirs = sorted(d for d in ctd_dirs if not any(s in d for s in excluded_CTD))
+    adcp_dirs = sorted(d for d in adcp_dirs if not any(s in d for s in excluded_ADCP))
+    return ctd_dirs, adcp_dirs
+
+def list_cruises(dirs, ctd_dirs, adcp_dirs):
+    '''
+    Combine the CTD and ADCP directories of each cruise.
+
+    Parameters
+    ----------
+    dirs : dict
+        The records of the directories as created by scan_directory
+    ctd_dirs : list
+        The paths to the directories containing CTD data
+    adcp_dirs : list
+        The paths to the directories containing ADCP data
+
+    Returns
+    -------
+    list
+        A list with a dictionary for each cruise, containing the cruise string 'GC_YYYY_MM', the CTD and ADCP
+        directories, their number of .cal and .vel files and their modification times. Sorted by cruise.
+    '''
+    cruises = {}
+    for kind, paths, count in [('ctd', ctd_dirs, 'n_cal'), ('adcp', adcp_dirs, 'n_vel')]:
+        for path in paths:
+            gc_string = [s for s in path.split(os.sep) if s.startswith('GC')]
+            name = gc_string[0][:10] if gc_string else path
+            cruise = cruises.setdefault(name, {'cruise': name, 'ctd_dir': None, 'adcp_dir': None, 'n_cal': 0,
+                                               'n_vel': 0, 'ctd_mtime': None, 'adcp_mtime': None})
+            record = dirs.get(path, {})
+            cruise[kind + '_dir'] = path
+            cruise[kind + '_mtime'] = record.get('mtime')
+            cruise[count] = record.get(count, 0)
+    return [cruises[name] for name in sorted(cruises)]
+
+def scan_archive(input_dir, previous=None):
+    '''
+    Scan the raw WBTS archive.
+
+    Parameters
+    ----------
+    input_dir : str
+        The path to the directory containing the WBTS data
+    previous : dict(optional)
+        An index of an earlier scan of input_dir, used to only list directories which changed
+
+    Returns
+    -------
+    dict
+        The index with the input_dir, the records of all directories, the CTD and ADCP directories
+        and the list of cruises
+    '''
+    if previous is not None and previous.get('input_dir') != input_dir:
+        previous = None
+    dirs = {}
+    scan_directory(input_dir, dirs, previous['dirs'] if previous else None)
+    ctd_dirs, adcp_dirs = find_data_dirs(dirs)
+    return {'input_dir': input_dir, 'dirs': dirs, 'ctd_dirs': ctd_dirs, 'adcp_dirs': adcp_dirs,
+            'cruises': list_cruises(dirs, ctd_dirs, adcp_dirs)}
+
+def load_index(index_path):
+    '''
+    Load an index saved by save_index.
+
+    Parameters
+    ----------
+    index_path : str
+        The path of the index file
+
+    Returns
+    -------
+    dict
+        The index, None if the file does not exist
+    '''
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, 'r') as file:
+        return json.load(file)
+
+def save_index(index, index_path):
+    '''
+    Save an index to a JSON file.
+
+    Parameters
+    ----------
+    index : dict
+        The index as returned by scan_archive
+    index_path : str
+        The path of the index file
+    '''
+    with open(index_path + '.tmp', 'w') as file:
+        json.dump(index, file)
+    os.replace(index_path + '.tmp', index_path)
+
+def get_index(input_dir, index_path=None):
+    '''
+    Get the index of the raw WBTS archive, refreshing the index saved in index_path.
+
+    Only the directories whose modification time changed since the saved index are listed again.
+
+    Parameters
+    ----------
+    input_dir : str
+        The path to the directory containing the WBTS data
+    index_path : str(optional)
+        The path of the index file. If not given, the archive is scanned without saving the index.
+
+    Returns
+    -------
+    dict
+        The index as returned by scan_archive
+    '''
+    previous = load_index(index_path) if index_path else None
+    index = scan_archive(input_dir, previous)
+    if index_path:
+        save_index(index, index_path)
+    return index
+
+def CTD_dirs(index):
+    '''
+    Get the CTD directories of an index.
+
+    Parameters
+    ----------
+    index : dict
+        The index as returned by get_index
+
+    Returns
+    -------
+    list
+        The paths to the directories containing CTD data
+    '''
+    return index['ctd_dirs']
+
+def ADCP_dirs(index):
+    '''
+    Get the ADCP directories of an index.
+
+    Parameters
+    ----------
+    index : dict
+        The index as returned by get_index
+
+    Returns
+    -------
+    list
+        The paths to the directories containing ADCP data
+    '''
+    return index['adcp_dirs']
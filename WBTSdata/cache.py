@@ -0,0 +1,256 @@
+import os
+import json
+import hashlib
+import collections
+import xarray as xr
+from WBTSdata import tools, manifest, pipeline, merge_datasets, load_cal_files, load_vel_files
+
+### default memory budget of the cache in bytes
+default_max_bytes = 2 * 2**30
+_default_cache = None
+
+
+class DatasetCache:
+    '''
+    Keep the datasets of cruises in memory during a session, evicting the least recently used datasets
+    when the memory budget is exceeded.
+
+    A dataset is stored under a key of the cruise, the product, the configuration section of the cruise,
+    the package version and the content of its input files, so that changed raw files or a changed
+    configuration create the dataset again. With a cache_dir the datasets are also saved as NetCDF files,
+    which are read when a dataset is not in memory, e.g. in a new session.
+
+    The cached datasets are shared between the callers: copy them before modifying their values in place.
+
+    Parameters
+    ----------
+    max_bytes : int(optional)
+        The memory budget in bytes. Datasets larger than the budget are not kept in memory.
+    cache_dir : str(optional)
+        The directory of the NetCDF files, None to keep the datasets only in memory
+    '''
+    def __init__(self, max_bytes=default_max_bytes, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = os.path.expanduser(cache_dir) if cache_dir else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._datasets = collections.OrderedDict()
+        self._nbytes = 0
+        ### the fingerprints of the input files, so that unchanged files are not hashed again
+        self._fingerprints = {}
+
+    def key(self, cruise, product, inputs, config_section):
+        '''
+        Compute the key of a dataset.
+
+        Parameters
+        ----------
+        cruise : str
+            The cruise, e.g. 'GC_2009_04'
+        product : str
+            The product, e.g. 'CTD', 'ADCP' or 'Merged'
+        inputs : list
+            The paths to the files the dataset is created from
+        config_section : dict
+            The configuration section used for the dataset
+
+        Returns
+        -------
+        str
+            The hex digest of the key
+        '''
+        fingerprint = manifest.fingerprint_files(inputs, self._fingerprints)
+        self._fingerprints.update(fingerprint)
+        content = {'cruise': cruise, 'product': product, 'version': manifest.package_version(),
+                   'config': manifest.config_hash(config_section),
+                   'inputs': sorted(f['sha256'] for f in fingerprint.values())}
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        '''
+        Get a dataset from memory or from the cache directory.
+
+        Parameters
+        ----------
+        key : str
+            The key as returned by key
+
+        Returns
+        -------
+        xarray.Dataset
+            The dataset, None if it is not in the cache
+        '''
+        if key in self._datasets:
+            self._datasets.move_to_end(key)
+            self.hits += 1
+            return self._datasets[key]
+        path = self._path(key)
+        if path is not None and os.path.exists(path):
+            with xr.open_dataset(path) as ds:
+                ds = ds.load()
+            self.disk_hits += 1
+            self._remember(key, ds)
+            return ds
+        return None
+
+    def put(self, key, ds):
+        '''
+        Store a dataset in memory and in the cache directory.
+
+        Parameters
+        ----------
+        key : str
+            The key as returned by key
+        ds : xarray.Dataset
+            The dataset, which is loaded into memory. The file is written with the encoding of tools.write_netcdf.
+        '''
+        ds = ds.load()
+        self._remember(key, ds)
+        path = self._path(key)
+        if path is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            ### write to a temporary file first, so an interrupted write does not leave a broken file
+            tools.write_netcdf(ds, path + '.tmp')
+            os.replace(path + '.tmp', path)
+
+    def fetch(self, key, create):
+        '''
+        Get a dataset from the cache, creating and storing it if it is not in the cache.
+
+        Parameters
+        ----------
+        key : str
+            The key as returned by key
+        create : callable
+            The function creating the dataset without arguments
+
+        Returns
+        -------
+        xarray.Dataset
+            The dataset
+        '''
+        ds = self.get(key)
+        if ds is None:
+            self.misses += 1
+            ds = create()
+            self.put(key, ds)
+            ds = self._datasets.get(key, ds)
+        return ds
+
+    def cruise(self, cal_dir=None, vel_dir=None, product='Merged', config=None):
+        '''
+        Get the dataset of a product of one cruise, see pipeline.build_cruise.
+
+        Parameters
+        ----------
+        cal_dir : str(optional)
+            The directory containing the .cal files
+        vel_dir : str(optional)
+            The directory containing the .vel files
+        product : str(optional)
+            One of 'CTD', 'ADCP' or 'Merged'
+        config : dict(optional)
+            The configuration dictionary
+
+        Returns
+        -------
+        xarray.Dataset
+            The dataset as returned by load_cal_files.create_Dataset, load_vel_files.create_Dataset or
+            merge_datasets.merge_datasets
+        '''
+        if not isinstance(config, dict):
+            config = tools.get_config()
+        inputs = pipeline.product_inputs(product, cal_dir, vel_dir)
+        if inputs is None:
+            raise ValueError(f"The {product} dataset cannot be created from cal_dir={cal_dir} and vel_dir={vel_dir}")
+        cruise = 'GC_' + pipeline.cruise_year(cal_dir if product != 'ADCP' else vel_dir)
+        create = {
+            'CTD': lambda: load_cal_files.create_Dataset(cal_dir, config),
+            'ADCP': lambda: load_vel_files.create_Dataset(vel_dir, config),
+            'Merged': lambda: merge_datasets.merge_datasets(cal_dir, vel_dir, config),
+        }[product]
+        return self.fetch(self.key(cruise, product, inputs, config.get(cruise, {})), create)
+
+    def merge_years(self, merge_dir):
+        '''
+        Get the merged dataset of all years, see merge_datasets.merge_years.
+
+        Parameters
+        ----------
+        merge_dir : str
+            The path to the directory containing the merged datasets of different years
+
+        Returns
+        -------
+        xarray.Dataset
+            The dataset containing the merged data of all years
+        '''
+        inputs = merge_datasets.merged_files(merge_dir)
+        return self.fetch(self.key('all_years', 'Merged', inputs, {}), lambda: merge_datasets.merge_years(merge_dir))
+
+    def clear(self, disk=False):
+        '''
+        Remove all datasets from memory, and from the cache directory if disk is True.
+
+        Parameters
+        ----------
+        disk : bool(optional)
+            Also delete the NetCDF files in the cache directory
+        '''
+        self._datasets.clear()
+        self._nbytes = 0
+        if disk and self.cache_dir is not None and os.path.isdir(self.cache_dir):
+            for file in os.listdir(self.cache_dir):
+                if file.endswith('.nc'):
+                    os.remove(os.path.join(self.cache_dir, file))
+
+    def info(self):
+        '''
+        Summarise the use of the cache.
+
+        Returns
+        -------
+        dict
+            The number of hits in memory and on disk, misses, datasets in memory and bytes in memory
+        '''
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'datasets': len(self._datasets), 'bytes': self._nbytes, 'max_bytes': self.max_bytes}
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.nc') if self.cache_dir is not None else None
+
+    def _remember(self, key, ds):
+        if key in self._datasets:
+            self._nbytes -= self._datasets.pop(key).nbytes
+        if ds.nbytes > self.max_bytes:
+            return
+        self._datasets[key] = ds
+        self._nbytes += ds.nbytes
+        ### evict the least recently used datasets
+        while self._nbytes > self.max_bytes:
+            _, evicted = self._datasets.popitem(last=False)
+            self._nbytes -= evicted.nbytes
+
+
+def get_cache(config=None):
+    '''
+    Get the cache shared by the whole session, created from the section cache of the configuration.
+
+    Parameters
+    ----------
+    config : dict(optional)
+        The configuration dictionary with the section cache containing max_bytes and cache_dir
+
+    Returns
+    -------
+    DatasetCache
+        The cache
+    '''
+    global _default_cache
+    if _default_cache is None:
+        if not isinstance(config, dict):
+            config = tools.get_config()
+        settings = config.get('cache') or {}
+        _default_cache = DatasetCache(settings.get('max_bytes', default_max_bytes), settings.get('cache_dir'))
+    return _default_cache
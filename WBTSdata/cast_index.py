@@ -0,0 +1,213 @@
+import os
+import json
+import numpy as np
+import xarray as xr
+from WBTSdata import vocabularies
+
+
+def index_path(path):
+    '''
+    Get the path of the cast index of a file.
+
+    The index is named after the full name of the file, so that a NetCDF file and a Zarr store of the same
+    product in one directory have their own indexes.
+
+    Parameters
+    ----------
+    path : str
+        The path to the NetCDF file or Zarr store, e.g. 'WBTS_all_years_CTD_LADCP.nc'
+
+    Returns
+    -------
+    str
+        The path of the index, e.g. 'WBTS_all_years_CTD_LADCP.nc.casts.json'
+    '''
+    return path.rstrip(os.sep) + '.casts.json'
+
+def section_of(lat, lon, boxes=vocabularies.section_boxes):
+    '''
+    Assign casts to the sections whose longitude and latitude range contains them.
+
+    Parameters
+    ----------
+    lat : np.ndarray
+        The latitudes of the casts
+    lon : np.ndarray
+        The longitudes of the casts
+    boxes : dict(optional)
+        The ranges of the sections, see vocabularies.section_boxes
+
+    Returns
+    -------
+    np.ndarray
+        The name of the section of each cast, '' if the cast is in no section
+    '''
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    sections = np.full(lat.shape, '', dtype=object)
+    for name, box in boxes.items():
+        inside = ((lon >= box['lon'][0]) & (lon <= box['lon'][1]) & (lat >= box['lat'][0]) & (lat <= box['lat'][1])
+                  & (sections == ''))
+        sections[inside] = name
+    return sections
+
+def create_cast_index(ds):
+    '''
+    Create the index of the casts of a dataset, reading only its coordinates and per-cast variables.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The dataset with the dimension DATETIME, e.g. the dataset of all years
+
+    Returns
+    -------
+    dict
+        The columns of the index: the position of each cast along DATETIME, DATETIME, CAST_NUMBER, GC_STRING,
+        LATITUDE, LONGITUDE, SECTION and the chunk along DATETIME the cast is stored in, plus the chunk size
+    '''
+    ### the chunks of the variables on (DATETIME, DEPTH) in the file
+    encodings = [ds[var].encoding for var in ds.data_vars if ds[var].dims[:1] == ('DATETIME',) and ds[var].ndim > 1]
+    chunks = [e.get('chunksizes') or e.get('preferred_chunks', {}).get('DATETIME') for e in encodings]
+    chunk = [c[0] if isinstance(c, tuple) else c for c in chunks if c]
+    chunk_size = chunk[0] if chunk else ds.sizes['DATETIME']
+    position = np.arange(ds.sizes['DATETIME'])
+    lat, lon = ds['LATITUDE'].values, ds['LONGITUDE'].values
+    return {
+        'position': position.tolist(),
+        'DATETIME': np.datetime_as_string(ds['DATETIME'].values, unit='s').tolist(),
+        'CAST_NUMBER': ds['CAST_NUMBER'].values.tolist(),
+        'GC_STRING': ds['GC_STRING'].values.astype(str).tolist(),
+        'LATITUDE': lat.tolist(),
+        'LONGITUDE': lon.tolist(),
+        'SECTION': section_of(lat, lon).tolist(),
+        'chunk': (position // chunk_size).tolist(),
+        'chunk_size': int(chunk_size),
+    }
+
+def write_cast_index(path):
+    '''
+    Create the cast index of a file and save it next to the file.
+
+    Parameters
+    ----------
+    path : str
+        The path to the NetCDF file or Zarr store
+
+    Returns
+    -------
+    dict
+        The index as returned by create_cast_index
+    '''
+    with xr.open_dataset(path) as ds:
+        index = create_cast_index(ds)
+    with open(index_path(path) + '.tmp', 'w') as file:
+        json.dump(index, file)
+    os.replace(index_path(path) + '.tmp', index_path(path))
+    return index
+
+def load_cast_index(path):
+    '''
+    Load the cast index of a file, creating it if it does not exist or is older than the file.
+
+    Parameters
+    ----------
+    path : str
+        The path to the NetCDF file or Zarr store
+
+    Returns
+    -------
+    dict
+        The index as returned by create_cast_index
+    '''
+    sidecar = index_path(path)
+    if not os.path.exists(sidecar) or os.path.getmtime(sidecar) < data_mtime(path):
+        return write_cast_index(path)
+    with open(sidecar, 'r') as file:
+        return json.load(file)
+
+def data_mtime(path):
+    '''
+    Get the modification time of a NetCDF file, or the latest modification time in a Zarr store.
+
+    Parameters
+    ----------
+    path : str
+        The path to the NetCDF file or Zarr store
+
+    Returns
+    -------
+    float
+        The modification time
+    '''
+    if not os.path.isdir(path):
+        return os.path.getmtime(path)
+    return max(os.path.getmtime(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+def match_casts(index, time=None, bbox=None, section=None, cruise=None):
+    '''
+    Find the casts of an index matching all given criteria.
+
+    Parameters
+    ----------
+    index : dict
+        The index as returned by create_cast_index
+    time : tuple(optional)
+        The first and last time, e.g. ('2010-01-01', '2015-12-31'), either can be None
+    bbox : tuple(optional)
+        The range (lon_min, lat_min, lon_max, lat_max), e.g. (-76.5, -90, 180, 90) for all casts east of 76.5°W
+    section : str or list(optional)
+        The sections, see vocabularies.section_boxes
+    cruise : str or list(optional)
+        The cruises, e.g. 'GC_2019_06'
+
+    Returns
+    -------
+    np.ndarray
+        The sorted positions of the matching casts along DATETIME
+    '''
+    match = np.ones(len(index['position']), dtype=bool)
+    if time is not None:
+        times = np.array(index['DATETIME'], dtype='datetime64[s]')
+        start, end = time
+        if start is not None:
+            match &= times >= np.datetime64(start)
+        if end is not None:
+            ### a date as end includes the whole day
+            end = np.datetime64(end)
+            match &= times < end + 1 if end.dtype == np.dtype('datetime64[D]') else times <= end
+    if bbox is not None:
+        lon, lat = np.array(index['LONGITUDE']), np.array(index['LATITUDE'])
+        match &= (lon >= bbox[0]) & (lat >= bbox[1]) & (lon <= bbox[2]) & (lat <= bbox[3])
+    if section is not None:
+        match &= np.isin(index['SECTION'], np.atleast_1d(section))
+    if cruise is not None:
+        match &= np.isin(index['GC_STRING'], np.atleast_1d(cruise))
+    return np.array(index['position'])[match]
+
+def select_casts(path, time=None, bbox=None, section=None, cruise=None):
+    '''
+    Read the casts of a file matching all given criteria, without reading the other casts.
+
+    The casts are found in the cast index of the file, so only the chunks holding matching casts are read.
+
+    Parameters
+    ----------
+    path : str
+        The path to the NetCDF file or Zarr store, e.g. the file written by merge_datasets.write_all_years
+    time : tuple(optional)
+        The first and last time, e.g. ('2010-01-01', '2015-12-31'), either can be None
+    bbox : tuple(optional)
+        The range (lon_min, lat_min, lon_max, lat_max)
+    section : str or list(optional)
+        The sections, see vocabularies.section_boxes
+    cruise : str or list(optional)
+        The cruises, e.g. 'GC_2019_06'
+
+    Returns
+    -------
+    xarray.Dataset
+        The matching casts, loaded into memory
+    '''
+    positions = match_casts(load_cast_index(path), time, bbox, section, cruise)
+    with xr.open_dataset(path) as ds:
+        return ds.isel(DATETIME=positions).load()
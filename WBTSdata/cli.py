@@ -0,0 +1,176 @@
+import os
+import sys
+import argparse
+import logging
+
+### the products built by the build commands
+build_commands = {
+    'build-ctd': 'CTD',
+    'build-adcp': 'ADCP',
+    'build-merged': 'Merged',
+}
+
+
+def build(args, config):
+    '''
+    Run a build command.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed arguments
+    config : dict
+        The configuration dictionary
+
+    Returns
+    -------
+    int
+        The exit code, 1 if any cruise failed
+    '''
+    from WBTSdata import pipeline
+    if args.io_threads is not None:
+        config = dict(config, io_threads=args.io_threads)
+    index = None
+    if args.index_path:
+        from WBTSdata import archive_index
+        index = archive_index.get_index(args.input_dir or config['input_dir'], args.index_path)
+    depth_grid = None
+    if getattr(args, 'regrid', False):
+        from WBTSdata import regrid
+        depth_grid = regrid.standard_grid(config)
+    reports = pipeline.build_archive(args.input_dir, args.output_dir, workers=args.workers,
+                                     build=(build_commands[args.command],), config=config,
+                                     incremental=args.incremental, index=index, report_path=args.report,
+                                     only=args.only, ragged=args.output_format == 'ragged', depth_grid=depth_grid)
+    failed = [r['cruise'] for r in reports if r['error'] is not None]
+    skipped = [r['cruise'] for r in reports if r['skipped']]
+    print(f"{len(reports) - len(failed) - len(skipped)} cruises built, {len(skipped)} up to date, {len(failed)} failed")
+    if failed:
+        print('Failed cruises: ', ' '.join(failed))
+    return 1 if failed else 0
+
+def merge_years(args, config):
+    '''
+    Run the merge-years command.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed arguments
+    config : dict
+        The configuration dictionary
+
+    Returns
+    -------
+    int
+        The exit code
+    '''
+    merge_dir = args.output_dir or config['output_dir']
+    if args.output_format == 'zarr':
+        from WBTSdata import zarr_store
+        path = args.path or os.path.join(merge_dir, 'Merged', 'WBTS_all_years_CTD_LADCP.zarr')
+        appended = zarr_store.append_years(merge_dir, path, pack=args.pack)
+        print(f"Appended {len(appended)} cruises to {path}")
+    else:
+        from WBTSdata import merge_datasets
+        path = merge_datasets.write_all_years(merge_dir, args.path, pack=args.pack)
+        print(f"Saved {path}")
+    return 0
+
+def index(args, config):
+    '''
+    Run the index command, printing the cruises of the archive.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed arguments
+    config : dict
+        The configuration dictionary
+
+    Returns
+    -------
+    int
+        The exit code
+    '''
+    from WBTSdata import archive_index
+    archive = archive_index.get_index(args.input_dir or config['input_dir'], args.index_path)
+    for cruise in archive['cruises']:
+        if args.only is None or cruise['cruise'] in args.only:
+            print(f"{cruise['cruise']}  {cruise['n_cal']:4d} .cal  {cruise['n_vel']:4d} .vel")
+    return 0
+
+def parser():
+    '''
+    Create the parser of the wbtsdata command.
+
+    Returns
+    -------
+    argparse.ArgumentParser
+        The parser
+    '''
+    main_parser = argparse.ArgumentParser(prog='wbtsdata', description='Create the WBTS data products.')
+    main_parser.add_argument('--config', help='path of the configuration file, defaults to $WBTSDATA_CONFIG '
+                                              'or config.yaml of the package')
+    main_parser.add_argument('-v', '--verbose', action='store_true',
+                             help='log the timing of the stages, see WBTSdata.instrumentation')
+    commands = main_parser.add_subparsers(dest='command', required=True)
+
+    for name, product in build_commands.items():
+        command = commands.add_parser(name, help=f'create the {product} files of all cruises')
+        command.add_argument('--input-dir', help='directory of the raw archive, defaults to input_dir of the configuration')
+        command.add_argument('--output-dir', help='directory of the created files, defaults to output_dir of the configuration')
+        command.add_argument('--workers', type=int, help='number of worker processes, defaults to the number of CPUs')
+        command.add_argument('--only', action='append', metavar='GC_YYYY_MM', help='only process this cruise, can be repeated')
+        command.add_argument('--incremental', action='store_true', help='skip the files which are up to date')
+        command.add_argument('--output-format', choices=['netcdf', 'ragged'], default='netcdf',
+                             help='padded NetCDF files or NetCDF files with contiguous ragged arrays, saved as *_ragged.nc')
+        command.add_argument('--index-path', help='path of the archive index to use and update')
+        command.add_argument('--io-threads', type=int, help='maximum number of raw files read at once by each worker, '
+                                                            'defaults to io_threads of the configuration')
+        command.add_argument('--report', help='write a JSON report of the build to this path')
+        if product == 'Merged':
+            command.add_argument('--regrid', action='store_true',
+                                 help='interpolate the casts onto the DEPTH grid in m of depth_grid of the configuration')
+        command.set_defaults(func=build)
+
+    command = commands.add_parser('merge-years', help='merge the merged files of all cruises')
+    command.add_argument('--output-dir', help='directory of the created files, defaults to output_dir of the configuration')
+    command.add_argument('--output-format', choices=['netcdf', 'zarr'], default='netcdf',
+                         help='one NetCDF file written anew, or a Zarr store the new cruises are appended to')
+    command.add_argument('--path', help='path of the file or store, defaults to Merged/WBTS_all_years_CTD_LADCP.nc '
+                                        'or .zarr in the output directory')
+    command.add_argument('--pack', action='store_true', help='pack the variables into int16 where possible')
+    command.set_defaults(func=merge_years)
+
+    command = commands.add_parser('index', help='list the cruises of the raw archive')
+    command.add_argument('--input-dir', help='directory of the raw archive, defaults to input_dir of the configuration')
+    command.add_argument('--index-path', help='path of the archive index to use and update')
+    command.add_argument('--only', action='append', metavar='GC_YYYY_MM', help='only list this cruise, can be repeated')
+    command.set_defaults(func=index)
+    return main_parser
+
+def main(argv=None):
+    '''
+    Run the wbtsdata command.
+
+    Parameters
+    ----------
+    argv : list(optional)
+        The arguments, defaults to sys.argv[1:]
+
+    Returns
+    -------
+    int
+        The exit code
+    '''
+    args = parser().parse_args(argv)
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(message)s')
+    ### the package is imported after parsing the arguments, so that --help does not wait for xarray
+    from WBTSdata import tools
+    config = tools.get_config(args.config)
+    return args.func(args, config)
+
+if __name__ == '__main__':
+    sys.exit(main())
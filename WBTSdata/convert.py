@@ -5,7 +5,7 @@ from WBTSdata import attr_input
 import logging
 import yaml
 import time
-from . import tools
+from . import tools, instrumentation
 
 _log = logging.getLogger(__name__)
 
@@ -178,6 +178,98 @@ def add_attributes(ds, config):
         ds.attrs[key] = value
     return ds
 
+def rename_map(ds, dims_rename=vocabularies.dims_rename_dict, standard_names=vocabularies.standard_names):
+    """
+    Compute the renaming of the dimensions and variables of a dataset for OG1, as done by rename_dimensions and
+    rename_variables, so that it can be applied with a single rename.
+
+    Parameters
+    ----------
+    ds (xarray.Dataset): The dataset to rename.
+    dims_rename (dict): A dictionary where keys are the old dimension names and values are the new dimension names.
+    standard_names (dict): A dictionary where keys are the old variable names and values are the new variable names.
+
+    Returns
+    -------
+    dict: The old names which are in ds as keys and the new names as values, empty if ds is already renamed.
+    """
+    names = {old: new for old, new in dims_rename.items() if old in ds.dims}
+    suffixes = ['', '_qc', '_raw', '_raw_qc']
+    for old_name, new_name in standard_names.items():
+        for suffix in suffixes:
+            variant, new_variant = old_name + suffix, new_name + suffix.upper()
+            if variant not in ds.variables:
+                continue
+            if new_variant in ds.variables:
+                print(f"Warning: Variable '{new_variant}' already exists in the dataset.")
+            else:
+                names[variant] = new_variant
+    return names
+
+def scale_units(ds, preferred_units=vocabularies.preferred_units, unit_conversion=vocabularies.unit_conversion,
+                vocab_attrs=vocabularies.vocab_attrs):
+    """
+    Convert the units of the variables of a dataset to the preferred units.
+
+    Variables whose units are already the units of vocab_attrs are not converted, so that converting a dataset
+    twice does not scale it twice.
+
+    Parameters
+    ----------
+    ds (xarray.Dataset): The dataset containing variables to convert. The converted variables are replaced by
+    scaled copies, the arrays of ds are not modified.
+    preferred_units (list): A list of strings representing the preferred units.
+    unit_conversion (dict): A dictionary mapping current units to conversion information, see tools.convert_units.
+    vocab_attrs (dict): A dictionary containing the vocabulary attributes of the variables.
+
+    Returns
+    -------
+    xarray.Dataset: The dataset with converted units.
+    """
+    for var in list(ds.variables):
+        current_unit = ds[var].attrs.get('units')
+        if current_unit not in unit_conversion or current_unit == vocab_attrs.get(var, {}).get('units'):
+            continue
+        conversion_info = unit_conversion[current_unit]
+        if conversion_info['units_name'] not in preferred_units:
+            continue
+        factor = conversion_info['factor']
+        variable = ds.variables[var]
+        if factor != 1:
+            ### scale out of place, the arrays may be shared with the dataset of the caller
+            ds[var] = (variable.dims, variable.data * factor, variable.attrs)
+        ds[var].attrs['units'] = conversion_info['units_name']
+    return ds
+
+def standardise(ds, config):
+    """
+    Standardise a dataset for OG1 in a single pass: rename dimensions and variables with one rename, convert the
+    units, assign the variable attributes and add the global attributes.
+
+    A dataset which is already standardised is not renamed or scaled again, so calling standardise twice
+    costs little more than setting the attributes.
+
+    Parameters
+    ----------
+    ds (xarray.Dataset): The dataset to standardise, it is not modified.
+    config (dict): The configuration dictionary.
+
+    Returns
+    -------
+    xarray.Dataset: The standardised dataset.
+    attr_warnings (set): A set containing warning messages for attribute mismatches.
+    """
+    if not isinstance(config, dict):
+        config = tools.get_config()
+    with instrumentation.stage('standardise', casts=ds.sizes.get('DATETIME')):
+        names = rename_map(ds)
+        ### rename returns a shallow copy, so that the variables and attributes of the caller are not replaced
+        ds = ds.rename(names) if names else ds.copy(deep=False)
+        ds = scale_units(ds)
+        ds, attr_warnings = assign_variable_attributes(ds)
+        ds = add_attributes(ds, config)
+    return ds, attr_warnings
+
 def process_dataset(ds, config):
     """
     Process a dataset by renaming dimensions and variables, assigning attributes, and adding attributes.
@@ -190,26 +282,6 @@ def process_dataset(ds, config):
     Returns
     -------
     xarray.Dataset: The processed dataset.
+    attr_warnings (set): A set containing warning messages for attribute mismatches.
     """
-
-
-    if not isinstance(config, dict):
-        config = tools.get_config()
-    # Extract the dataset for 'sg_data_point'
-    # Must be after split_ds
-    renamed_ds = rename_dimensions(ds)
-    # Rename variables according to the OG1 vocabulary
-    # Must be after rename_dimensions
-    renamed_ds = rename_variables(renamed_ds)
-    # Convert units in renamed_ds (especially cm/s to m/s)
-    renamed_ds = tools.convert_units(renamed_ds)
-    # Assign attributes to the variables
-    # Must be ater rename_variables
-    renamed_ds, attr_warnings = assign_variable_attributes(renamed_ds)
-    # Add attributes to the dataset
-    renamed_ds = add_attributes(renamed_ds, config)
-
-    #vars_to_remove = vocabularies.vars_to_remove
-    #ds_new = ds_new.drop_vars([var for var in vars_to_remove if var in ds_new.variables])
-
-    return renamed_ds, attr_warnings
\ No newline at end of file
+    return standardise(ds, config)
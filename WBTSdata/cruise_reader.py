@@ -0,0 +1,120 @@
+import os
+import collections
+import pandas as pd
+from WBTSdata import load_cal_files, load_vel_files
+
+
+class CruiseReader:
+    '''
+    Read the casts of a directory of .cal or .vel files one at a time.
+
+    Only the headers of the files are parsed when the reader is created. The table of a cast is read on first
+    access with reader[cast_number], and the tables of the most recently read casts are kept in memory.
+
+    Parameters
+    ----------
+    directory : str
+        The directory containing the .cal or .vel files of one cruise
+    cache_size : int(optional)
+        The number of cast tables kept in memory, 0 to read the file on every access
+
+    Examples
+    --------
+    >>> reader = CruiseReader('GC_2009_04/CTD')
+    >>> reader.casts
+    >>> reader[17]
+    '''
+    def __init__(self, directory, cache_size=8):
+        self.directory = directory
+        self.cache_size = cache_size
+        self._tables = collections.OrderedDict()
+        files = sorted(os.listdir(directory))
+        cal_files = [f for f in files if f.endswith('.cal')]
+        if cal_files:
+            self.extension = '.cal'
+            self.casts = self._cal_table(cal_files)
+        else:
+            self.extension = '.vel'
+            self.casts = self._vel_table([f for f in files if f.endswith('.vel')])
+
+    def _cal_table(self, cal_files):
+        tokens = [load_cal_files.read_cal_header(os.path.join(self.directory, f)) for f in cal_files]
+        Cast, Lat, Lon, Datetime, time_flag = load_cal_files.parse_cal_headers(tokens, cal_files)
+        table = pd.DataFrame({'file': cal_files, 'lat': Lat, 'lon': Lon, 'datetime': Datetime,
+                              'time_flag': time_flag}, index=pd.Index(Cast, name='cast'))
+        return table.sort_index(kind='stable')
+
+    def _vel_table(self, vel_files):
+        headers = [load_vel_files.read_vel_header(os.path.join(self.directory, f)) for f in vel_files]
+        table = pd.DataFrame({
+            'file': vel_files,
+            'configuration': [h.configuration for h in headers],
+            'lat': [h.start.lat for h in headers],
+            'lon': [h.start.lon for h in headers],
+            'datetime': pd.to_datetime([h.start.datetime for h in headers]),
+            'end_datetime': pd.to_datetime([h.end.datetime for h in headers]),
+            'avg_lat': [h.avg.lat for h in headers],
+            'avg_lon': [h.avg.lon for h in headers],
+        }, index=pd.Index([h.cast for h in headers], name='cast', dtype=int))
+        return table.sort_index(kind='stable')
+
+    def path(self, cast):
+        '''
+        Get the path of the file of a cast.
+
+        Parameters
+        ----------
+        cast : int
+            The cast number
+
+        Returns
+        -------
+        str
+            The path of the file
+        '''
+        if cast not in self.casts.index:
+            raise KeyError(f"Cast {cast} is not in {self.directory}")
+        files = self.casts.loc[[cast], 'file']
+        if len(files) > 1:
+            print(f"Warning: Cast {cast} is in several files, reading {files.iloc[0]}")
+        return os.path.join(self.directory, files.iloc[0])
+
+    def __getitem__(self, cast):
+        '''
+        Read the table of a cast.
+
+        Parameters
+        ----------
+        cast : int
+            The cast number
+
+        Returns
+        -------
+        pandas.DataFrame
+            The table with the columns of load_cal_files.column_names or load_vel_files.column_names, as in
+            load_cal_files.load_cal_from_file and load_vel_files.load_vel_from_file
+        '''
+        if cast in self._tables:
+            self._tables.move_to_end(cast)
+            return self._tables[cast]
+        if self.extension == '.cal':
+            table = pd.DataFrame(load_cal_files.read_cal_file(self.path(cast))[1], columns=load_cal_files.column_names)
+        else:
+            table = pd.DataFrame(load_vel_files.read_vel_file(self.path(cast)).data, columns=load_vel_files.column_names)
+        if self.cache_size > 0:
+            self._tables[cast] = table
+            if len(self._tables) > self.cache_size:
+                self._tables.popitem(last=False)
+        return table
+
+    def __len__(self):
+        return len(self.casts)
+
+    def __iter__(self):
+        return iter(self.casts.index.unique())
+
+    def __contains__(self, cast):
+        return cast in self.casts.index
+
+    def __repr__(self):
+        return f"CruiseReader({self.directory!r}, {len(self)} {self.extension} casts)"
@@ -0,0 +1,193 @@
+import copy
+import numpy as np
+import pandas as pd
+import xarray as xr
+from WBTSdata import vocabularies, cast_index, ragged, regrid
+
+
+def station_pairs(ds):
+    '''
+    Order the casts of a dataset into sections and find the pairs of neighbouring casts.
+
+    The casts are sorted by cruise, section and LONGITUDE, and neighbours belonging to different cruises or
+    sections are not paired.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The padded dataset with the dimension DATETIME, of one cruise or of several
+
+    Returns
+    -------
+    order : np.ndarray
+        The positions of the casts along DATETIME in sorted order
+    paired : np.ndarray
+        For each sorted cast except the last, whether it forms a pair with the next cast
+    '''
+    lat, lon = ds['LATITUDE'].values, ds['LONGITUDE'].values
+    cruises = ds['GC_STRING'].values.astype(str) if 'GC_STRING' in ds else np.full(lon.shape, '')
+    sections = cast_index.section_of(lat, lon).astype(str)
+    order = np.lexsort((lon, sections, cruises))
+    paired = (cruises[order][1:] == cruises[order][:-1]) & (sections[order][1:] == sections[order][:-1])
+    return order, paired
+
+def sea_pressure(ds, level):
+    '''
+    Get the pressure of every observation of a dataset.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The padded dataset with the dimensions DATETIME and level
+    level : str
+        The vertical coordinate of ds, 'PRES' or 'DEPTH'
+
+    Returns
+    -------
+    np.ndarray
+        The pressure in dbar, shape (casts, levels)
+    '''
+    shape = (ds.sizes['DATETIME'], ds.sizes[level])
+    if level == 'PRES':
+        return np.broadcast_to(ds['PRES'].values.astype(float), shape)
+    import gsw
+    return gsw.p_from_z(-np.broadcast_to(ds['DEPTH'].values.astype(float), shape), ds['LATITUDE'].values[:, np.newaxis])
+
+def geostrophic_velocity(ds, p_ref=0):
+    '''
+    Compute the geostrophic velocity between all pairs of neighbouring casts of a CTD dataset.
+
+    Absolute Salinity, Conservative Temperature and the dynamic height streamfunction of all casts are computed
+    with one gsw call each on the (cast x level) arrays, and the velocities of all pairs with one call of
+    gsw.geostrophic_velocity. Levels without data inside a cast are interpolated in the streamfunction. The casts
+    are paired along LONGITUDE within each cruise and section, see station_pairs, so the velocity is positive to
+    the left of eastward, i.e. roughly northward.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The dataset with TEMP and PSAL, e.g. from load_cal_files.create_Dataset on PRES or from
+        merge_datasets.merge_datasets on DEPTH
+    p_ref : float(optional)
+        The reference pressure in dbar, the velocity is relative to the velocity at this pressure
+
+    Returns
+    -------
+    xarray.Dataset
+        GEOSTROPHIC_VELOCITY on the dimensions PAIR and the level of ds, with the LONGITUDE and LATITUDE of the
+        midpoints and the DATETIME, CAST_NUMBER and GC_STRING of the first and second cast of each pair
+    '''
+    import gsw
+    if 'rowSize' in ds:
+        ds = ragged.to_padded(ds)
+    level = 'PRES' if 'PRES' in ds.dims else 'DEPTH'
+    order, paired = station_pairs(ds)
+    ds = ds.isel(DATETIME=order)
+    lat, lon = ds['LATITUDE'].values, ds['LONGITUDE'].values
+    p = sea_pressure(ds, level)
+    SA = gsw.SA_from_SP(ds['PSAL'].transpose('DATETIME', level).values, p, lon[:, np.newaxis], lat[:, np.newaxis])
+    CT = gsw.CT_from_t(SA, ds['TEMP'].transpose('DATETIME', level).values, p)
+    ### gsw expects the pressure along axis 0 and the casts along axis 1
+    strf = gsw.geo_strf_dyn_height(SA.T, CT.T, p.T, p_ref=p_ref, axis=0)
+    ### levels without data inside a cast are interpolated, so that neighbouring casts share their levels
+    levels = ds[level].values.astype(float)
+    strf = regrid.interpolate_profiles(levels[np.newaxis, :], strf.T, levels).T
+    velocity, mid_lon, mid_lat = gsw.geostrophic_velocity(strf, lon, lat, axis=0)
+
+    first, second = np.nonzero(paired)[0], np.nonzero(paired)[0] + 1
+    pairs = xr.Dataset(coords={level: ds[level]})
+    pairs['GEOSTROPHIC_VELOCITY'] = xr.Variable(('PAIR', level), velocity.T[paired],
+                                                copy.deepcopy(vocabularies.vocab_attrs['GEOSTROPHIC_VELOCITY']))
+    pairs['GEOSTROPHIC_VELOCITY'].attrs['reference_pressure'] = p_ref
+    pairs.coords['LONGITUDE'] = xr.Variable('PAIR', mid_lon[paired], ds['LONGITUDE'].attrs)
+    pairs.coords['LATITUDE'] = xr.Variable('PAIR', mid_lat[paired], ds['LATITUDE'].attrs)
+    for var in ['DATETIME', 'CAST_NUMBER', 'GC_STRING']:
+        if var in ds:
+            pairs[var + '_1'] = xr.Variable('PAIR', ds[var].values[first], ds[var].attrs)
+            pairs[var + '_2'] = xr.Variable('PAIR', ds[var].values[second], ds[var].attrs)
+    for var in ['LONGITUDE', 'LATITUDE']:
+        pairs[var + '_1'] = xr.Variable('PAIR', ds[var].values[first], ds[var].attrs)
+        pairs[var + '_2'] = xr.Variable('PAIR', ds[var].values[second], ds[var].attrs)
+    pairs.attrs = ds.attrs
+    return pairs
+
+def pair_normal(pairs):
+    '''
+    Get the unit vector to the left of the direction from the first to the second cast of every pair.
+
+    Parameters
+    ----------
+    pairs : xarray.Dataset
+        The pairs as returned by geostrophic_velocity
+
+    Returns
+    -------
+    np.ndarray
+        The eastward and northward component of the normal of each pair, shape (pairs, 2)
+    '''
+    dx = (pairs['LONGITUDE_2'].values - pairs['LONGITUDE_1'].values) * np.cos(np.deg2rad(pairs['LATITUDE'].values))
+    dy = pairs['LATITUDE_2'].values - pairs['LATITUDE_1'].values
+    normal = np.stack([-dy, dx], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return normal / np.hypot(dx, dy)[:, np.newaxis]
+
+def reference_to_ladcp(pairs, ds_ladcp, depth_range=None):
+    '''
+    Reference the geostrophic velocity of the pairs to the LADCP velocity of the same casts.
+
+    The LADCP velocity of both casts is rotated to the normal of the pair and averaged. The reference velocity
+    of a pair is the mean difference between this velocity and the geostrophic velocity over the depths where
+    both exist. The casts are matched by GC_STRING and CAST_NUMBER, and all pairs are processed at once.
+
+    Parameters
+    ----------
+    pairs : xarray.Dataset
+        The pairs as returned by geostrophic_velocity
+    ds_ladcp : xarray.Dataset
+        The dataset with U_WATER_VELOCITY and V_WATER_VELOCITY on DEPTH, e.g. from merge_datasets.merge_datasets
+    depth_range : tuple(optional)
+        The shallowest and deepest depth in m used for the reference, e.g. (200, 1000) to exclude the surface layer
+
+    Returns
+    -------
+    xarray.Dataset
+        The pairs with the REFERENCE_VELOCITY of each pair and ABSOLUTE_GEOSTROPHIC_VELOCITY, NaN for pairs
+        without LADCP velocity in the depth range
+    '''
+    if 'rowSize' in ds_ladcp:
+        ds_ladcp = ragged.to_padded(ds_ladcp)
+    casts = pd.MultiIndex.from_arrays([ds_ladcp['GC_STRING'].values.astype(str),
+                                       ds_ladcp['CAST_NUMBER'].values.astype(float)])
+    depth = ds_ladcp['DEPTH'].values.astype(float)
+    normal = pair_normal(pairs)
+    ladcp_normal = np.zeros((pairs.sizes['PAIR'], len(depth)))
+    for cast in ['_1', '_2']:
+        positions = casts.get_indexer(pd.MultiIndex.from_arrays([pairs['GC_STRING' + cast].values.astype(str),
+                                                                 pairs['CAST_NUMBER' + cast].values.astype(float)]))
+        ### the bins of the LADCP are interpolated onto all levels of DEPTH within the range of each cast
+        u, v = [regrid.interpolate_profiles(depth[np.newaxis, :],
+                                            ds_ladcp[var].transpose('DATETIME', 'DEPTH').values[positions], depth)
+                for var in ['U_WATER_VELOCITY', 'V_WATER_VELOCITY']]
+        ### pairs with a cast missing in ds_ladcp get NaN
+        ladcp_normal += np.where((positions >= 0)[:, np.newaxis], normal[:, :1] * u + normal[:, 1:] * v, np.nan) / 2
+
+    level = 'PRES' if 'PRES' in pairs.dims else 'DEPTH'
+    geostrophic = pairs['GEOSTROPHIC_VELOCITY'].transpose('PAIR', level).values
+    if level == 'PRES':
+        z = regrid.depth_from_pressure(np.broadcast_to(pairs['PRES'].values, geostrophic.shape), pairs['LATITUDE'].values)
+    else:
+        z = pairs['DEPTH'].values[np.newaxis, :]
+    difference = ladcp_normal - regrid.interpolate_profiles(z, geostrophic, depth)
+    if depth_range is not None:
+        difference[:, (depth < depth_range[0]) | (depth > depth_range[1])] = np.nan
+    count = np.sum(~np.isnan(difference), axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        reference = np.where(count > 0, np.nansum(difference, axis=1) / count, np.nan)
+
+    pairs = pairs.copy()
+    pairs['REFERENCE_VELOCITY'] = xr.Variable('PAIR', reference, {'long_name': 'Mean LADCP minus geostrophic velocity',
+                                                                  'units': 'm s-1'})
+    pairs['ABSOLUTE_GEOSTROPHIC_VELOCITY'] = xr.Variable(
+        ('PAIR', level), geostrophic + reference[:, np.newaxis],
+        copy.deepcopy(vocabularies.vocab_attrs['ABSOLUTE_GEOSTROPHIC_VELOCITY']))
+    return pairs
@@ -0,0 +1,205 @@
+import os
+import io
+import sys
+import json
+import time
+import logging
+import cProfile
+import pstats
+import contextlib
+
+try:
+    import resource
+except ImportError:
+    ### not available on Windows
+    resource = None
+
+_log = logging.getLogger(__name__)
+
+### environment variable switching on cProfile for one stage, as 'stage' or 'stage:directory'
+profile_env_var = 'WBTSDATA_PROFILE'
+### the collectors of the stage records, the innermost one receives the records
+_collectors = []
+### the statistics of the profiled stages saved by this process, keyed by path
+_profiles = {}
+
+
+def peak_rss():
+    '''
+    Get the peak resident set size of the current process.
+
+    This is the high-water mark over the lifetime of the process, not of a single stage: a stage using less
+    memory than an earlier one reports the peak of the earlier stage. See current_rss for the memory of a stage.
+
+    Returns
+    -------
+    int
+        The peak RSS in bytes, None if it is not available on the platform
+    '''
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    ### ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def current_rss():
+    '''
+    Get the current resident set size of the current process (Linux only).
+
+    Returns
+    -------
+    int
+        The RSS in bytes, None if it is not available on the platform
+    '''
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def profiled_stage():
+    '''
+    Get the stage to profile from the environment variable WBTSDATA_PROFILE.
+
+    Returns
+    -------
+    tuple
+        The name of the stage and the directory the profiles are saved in (None to log them), or (None, None)
+    '''
+    name, _, directory = os.environ.get(profile_env_var, '').partition(':')
+    return (name or None), (directory or None)
+
+@contextlib.contextmanager
+def collect(cruise=None):
+    '''
+    Collect the records of all stages run inside the context.
+
+    Parameters
+    ----------
+    cruise : str(optional)
+        The cruise added to the records, e.g. 'GC_2009_04'
+
+    Yields
+    ------
+    list
+        The list the records are appended to
+    '''
+    records = []
+    _collectors.append((cruise, records))
+    try:
+        yield records
+    finally:
+        _collectors.pop()
+
+@contextlib.contextmanager
+def stage(name, **info):
+    '''
+    Time a stage of the pipeline and record its memory use.
+
+    The record holds the current RSS at the end of the stage ('rss'), its change during the stage ('rss_change'),
+    which is negative if the stage released memory, and the peak RSS of the process so far ('peak_rss'),
+    see current_rss and peak_rss. The record is logged at INFO level as key=value pairs and appended to the innermost collector. Further
+    information, e.g. the number of casts or bytes read, can be passed as keywords or set in the yielded record.
+    If the stage is selected by WBTSDATA_PROFILE, it is run under cProfile.
+
+    Parameters
+    ----------
+    name : str
+        The name of the stage, e.g. 'discover', 'parse_headers', 'parse_bodies', 'build', 'standardise',
+        'merge' or 'write'
+    **info
+        Further entries of the record
+
+    Yields
+    ------
+    dict
+        The record of the stage
+    '''
+    cruise, records = _collectors[-1] if _collectors else (None, None)
+    record = {'stage': name, 'cruise': cruise}
+    record.update(info)
+    profile_name, profile_dir = profiled_stage()
+    profiler = cProfile.Profile() if profile_name == name else None
+    rss_start = current_rss()
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        record['seconds'] = time.perf_counter() - start
+        record['rss'] = current_rss()
+        record['rss_change'] = record['rss'] - rss_start if rss_start is not None else None
+        record['peak_rss'] = peak_rss()
+        _log.info(' '.join(f'{key}={value}' for key, value in record.items()))
+        if records is not None:
+            records.append(record)
+        if profiler is not None:
+            save_profile(profiler, name, cruise, profile_dir)
+
+def save_profile(profiler, name, cruise=None, directory=None):
+    '''
+    Save the statistics of a profiled stage, or log the 20 functions with the largest cumulative time.
+
+    The statistics of a stage which runs several times for a cruise in the same process are added up.
+
+    Parameters
+    ----------
+    profiler : cProfile.Profile
+        The profiler of the stage
+    name : str
+        The name of the stage
+    cruise : str(optional)
+        The cruise the stage was run for
+    directory : str(optional)
+        The directory the statistics are saved in as '<stage>_<cruise>.prof', defaults to logging them
+    '''
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{name}_{cruise or "all"}.prof')
+        if path in _profiles:
+            _profiles[path].add(profiler)
+        else:
+            _profiles[path] = pstats.Stats(profiler)
+        _profiles[path].dump_stats(path)
+    else:
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(20)
+        _log.info('profile of stage %s of %s\n%s', name, cruise, stream.getvalue())
+
+def files_size(paths):
+    '''
+    Get the total size of files.
+
+    Parameters
+    ----------
+    paths : list
+        The paths to the files
+
+    Returns
+    -------
+    int
+        The number of bytes
+    '''
+    return sum(os.path.getsize(path) for path in paths)
+
+def write_report(reports, path, stages=None):
+    '''
+    Write the reports of a build, including the records of their stages, to a JSON file.
+
+    The file holds an object with the records of the stages run for all cruises, e.g. 'discover', under
+    'stages' and the reports of the cruises under 'cruises'.
+
+    Parameters
+    ----------
+    reports : list
+        The reports as returned by pipeline.build_archive
+    path : str
+        The path of the JSON file
+    stages : list(optional)
+        The records of the stages which do not belong to a cruise
+    '''
+    with open(path, 'w') as file:
+        json.dump({'stages': stages or [], 'cruises': reports}, file, indent=1, default=str)
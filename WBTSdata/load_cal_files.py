@@ -1,16 +1,195 @@
 import numpy as np
 import pandas as pd
 import os
+import io
 import xarray as xr
-import datetime
+import collections
+import concurrent.futures
+import itertools
 from WBTSdata import missing_datetime_2005_05 as mdt
 from WBTSdata.convert import process_dataset
-from WBTSdata import tools
+from WBTSdata import tools, instrumentation, ragged as ragged_arrays
 
 column_names = ["pr", "te", "th", "sa", "ht", "ga", "ox"]
 units = ["dbars", "deg c", "deg c", "psu", "dyn. cm", "gamma", "umol/kg"]
 
 
+CalCast = collections.namedtuple('CalCast', ['cast', 'lat', 'lon', 'datetime', 'time_flag', 'data'])
+CalCast.__doc__ = """
+Parsed content of a single .cal file.
+
+Fields
+------
+cast : int
+    The cast number from the header.
+lat, lon : float
+    The position of the cast.
+datetime : np.datetime64
+    The date and time of the cast.
+time_flag : int
+    0 for the start time of the cast, 1 if the start time needs to be checked in the cruise report
+    and 2 for the end time of the cast (May 2005).
+data : np.ndarray
+    The numeric block of the file with one column per entry in column_names.
+"""
+
+header_lines = 12
+
+
+def parse_cal_headers(tokens, file_names):
+    """
+    Parse the second header lines of all .cal files of a cruise at once.
+
+    The dates and times are normalised on arrays of the raw tokens and converted to datetime64 directly,
+    without formatting and parsing strings for every file.
+
+    Parameters
+    ----------
+    tokens : list
+        For every file, the whitespace separated tokens of the second header line.
+    file_names : list
+        The names of the .cal files, used to identify the cruise and the cast for May 2005.
+
+    Returns
+    -------
+    tuple
+        np.ndarrays of the cast number, latitude, longitude, datetime64[ns] and time flag of the casts.
+    """
+    n = np.array([len(sl) for sl in tokens])
+    tok = np.array([list(sl[:8]) + [''] * (8 - len(sl)) for sl in tokens], dtype=str).reshape(len(tokens), 8)
+    pad = lambda a: np.char.zfill(a, 2)
+    ### the date is split into 2 (7 tokens) or 3 (8 tokens) tokens in some files
+    date = np.where(n == 7, np.char.add(pad(tok[:, 4]), pad(tok[:, 5])), tok[:, 4])
+    date = np.where(n == 8, np.char.add(np.char.add(pad(tok[:, 4]), pad(tok[:, 5])), pad(tok[:, 6])), date)
+    gmt = np.where(n == 7, tok[:, 6], np.where(n == 8, tok[:, 7], tok[:, 5]))
+    lon = tok[:, 2]
+
+    ### change the format of the gmt data
+    time_flag = np.zeros(len(tokens), dtype=int)
+    year = np.array([int(f[2:6]) for f in file_names], dtype=int)
+    may_2005 = year == 505
+    if may_2005.any():
+        ### the files of May 2005 contain no date and time, they are taken from the cruise report
+        cast_index = np.array([int(f[7:9]) if m else 0 for f, m in zip(file_names, may_2005)], dtype=int)
+        time_flag[may_2005] = 2
+        lon = np.where(may_2005, np.char.replace(lon, '-735234', ''), lon)
+        date = np.where(may_2005, mdt.dates()[cast_index], date)
+        gmt = np.where(may_2005, mdt.times()[cast_index], gmt)
+    hhmm = gmt.astype(int)
+    length = np.char.str_len(gmt)
+    ### times with 2 or 3 digits lack a zero in front of the minutes, e.g. 175 for 17:05
+    fix = (703 < year) & (year < 1705)
+    short = fix & ((length == 2) | (length == 3)) & (hhmm % 100 > 59)
+    hhmm = np.where(short, hhmm // 10 * 100 + hhmm % 10, hhmm)
+    ### 3 digits starting with 1 or 2 could also be a time after 10:00 lacking the last digit
+    ambiguous = fix & (length == 3) & ~short & (0 < hhmm // 100) & (hhmm // 100 < 3)
+    time_flag[ambiguous] = 1
+
+    ### create datetime64 values from the date and time
+    mdy = pd.Series(date).str.split('/', expand=True).astype(int).to_numpy()
+    yy = mdy[:, 2]
+    Datetime = pd.to_datetime(pd.DataFrame({'year': np.where(yy < 69, 2000 + yy, 1900 + yy), 'month': mdy[:, 0],
+                                            'day': mdy[:, 1], 'hour': hhmm // 100, 'minute': hhmm % 100}))
+    return (tok[:, 0].astype(int), tok[:, 1].astype(float), lon.astype(float),
+            Datetime.to_numpy(dtype='datetime64[ns]'), time_flag)
+
+def parse_cal_file(buf):
+    """
+    Parse the content of a single .cal file, the header and the numeric block in one pass.
+
+    Parameters
+    ----------
+    buf : bytes
+        The content of the .cal file.
+
+    Returns
+    -------
+    tokens : list
+        The whitespace separated tokens of the second header line.
+    data : np.ndarray
+        The numeric block of the file.
+    """
+    pos = 0
+    for _ in range(header_lines):
+        pos = buf.find(b'\n', pos) + 1
+        if pos == 0:
+            pos = len(buf)
+            break
+    header = buf[:pos].decode('utf-8').splitlines()
+    data = pd.read_csv(io.BytesIO(buf[pos:]), names=column_names, sep=r'\s+').to_numpy(dtype=float)
+    return header[1].split(), data
+
+def read_cal_file(path):
+    """
+    Read a single .cal file, parsing the header and the numeric block in one pass.
+
+    Parameters
+    ----------
+    path : str
+        The path to the .cal file.
+
+    Returns
+    -------
+    tokens : list
+        The whitespace separated tokens of the second header line.
+    data : np.ndarray
+        The numeric block of the file.
+    """
+    with open(path, 'rb') as file:
+        return parse_cal_file(file.read())
+
+def read_cal_header(path):
+    """
+    Read the header of a single .cal file without reading the numeric block.
+
+    Parameters
+    ----------
+    path : str
+        The path to the .cal file.
+
+    Returns
+    -------
+    list
+        The whitespace separated tokens of the second header line.
+    """
+    with open(path, 'r') as file:
+        header = [file.readline() for _ in range(header_lines)]
+    return header[1].split()
+
+def load_cal_casts(cal_dir, threads=1):
+    """
+    Read all .cal files in a directory, opening every file once.
+
+    Parameters
+    ----------
+    cal_dir : str
+        The directory containing the .cal files.
+    threads : int(optional)
+        The maximum number of files read at once, see tools.read_files. The files are parsed in order.
+
+    Returns
+    -------
+    list
+        A list of CalCast records sorted by the Cast number.
+    """
+    cal_files = [f for f in os.listdir(cal_dir) if f.endswith('.cal')]
+    paths = [os.path.join(cal_dir, cal_file) for cal_file in cal_files]
+    with instrumentation.stage('parse_bodies', casts=len(paths), bytes=0) as record:
+        files = []
+        ### the bytes are counted as the files are read, a stat of every file up front would be a serial round trip
+        for buf in tools.read_files(paths, threads):
+            record['bytes'] += len(buf)
+            files.append(parse_cal_file(buf))
+    if not files:
+        return []
+    with instrumentation.stage('parse_headers', casts=len(files)):
+        Cast, Lat, Lon, Datetime, time_flag = parse_cal_headers([tokens for tokens, _ in files], cal_files)
+    casts = [CalCast(*fields, data) for *fields, (_, data)
+             in zip(Cast.tolist(), Lat.tolist(), Lon.tolist(), Datetime, time_flag.tolist(), files)]
+    ### sort the casts by the Cast number
+    casts.sort(key=lambda x: x.cast)
+    return casts
+
 def load_cal_from_file(cal_dir):
     """
     Load calibration data from a directory of .cal files.
@@ -24,15 +203,9 @@ def load_cal_from_file(cal_dir):
     Returns
     -------
     list
-        A list of pandas DataFrames containing the calibration data.
+        A list of pandas DataFrames containing the calibration data, sorted by the Cast number.
     """
-    cal_files = [f for f in os.listdir(cal_dir) if f.endswith('.cal')]
-    cal_list = []
-    ### sort the files by the Cast number
-    cal_files = sorted(cal_files, key=lambda x: int(x[6:8]))
-    for cal_file in cal_files:
-        cal_list.append(pd.read_csv(os.path.join(cal_dir, cal_file), names=column_names, skiprows=12, sep='\s+'))
-    return cal_list
+    return [pd.DataFrame(c.data, columns=column_names) for c in load_cal_casts(cal_dir)]
 
 def create_coordinates(cal_dir):
     '''
@@ -46,72 +219,13 @@ def create_coordinates(cal_dir):
     Returns
     -------
     list
-        A list of lists containing the coordinates.
+        A list of lists containing the Cast number, latitude, longitude, datetime string and time flag,
+        sorted by the Cast number. The latitude and longitude are floats, not the strings of the header.
     '''
-    cal_files = [f for f in os.listdir(cal_dir) if f.endswith('.cal')]
-    coordinates = []
-    for i in cal_files:
-        with open(cal_dir +'/'+ i, 'r') as file:
-            fl = file.readline().split()
-            sl = file.readline().split()
-            ### bring date into the right shape and add it to the list. 
-            if len(sl) == 7:
-                if len(sl[5]) < 2:
-                    sl[5] = '0'+sl[5]
-                if len(sl[4]) < 2:
-                    sl[4] = '0'+sl[4]
-                sl[4] = sl[4] +sl[5]
-                sl.pop(5)
-            if len(sl) == 8:
-                if len(sl[4]) < 2:
-                    sl[4] = '0'+sl[4]
-                if len(sl[5]) < 2:
-                    sl[5] = '0'+sl[5]
-                if len(sl[6]) < 2:
-                    sl[6] = '0'+sl[6]
-                sl[4] = sl[4] +sl[5] +sl[6]
-                sl.pop(5)
-                sl.pop(5)
-
-            ### change the format of the gmt data
-            time_flag = 0
-            year = i[2:6]
-            if 505 == int(year):
-                time_flag = 2
-                dates = mdt.dates()
-                times = mdt.times()
-                sl[2] = sl[2].replace('-735234','')
-                sl[3] = '0'
-                sl[4] = dates[int(i[7:9])]
-                sl[5] = times[int(i[7:9])]
-            if 703 < int(year) < 1705:
-                if len(sl[5]) == 3:
-                    if int(sl[5][-2:]) > 59:
-                        sl[5] = sl[5][:2] + '0' + sl[5][2]
-                    elif 0 < int(sl[5][-3]) < 3:
-                        time_flag = 1
-                elif len(sl[5]) == 2:
-                    if int(sl[5][-2:]) > 59:
-                        sl[5] = sl[5][0] + '0' + sl[5][1] 
-            for i in range(3):
-                if len(sl[5]) < 4:
-                    sl[5] = '0'+sl[5]
-
-            ### create a datetime object from the date and time
-            Datetime = datetime.datetime.strptime(sl[4]+sl[5], '%m/%d/%y%H%M').strftime('%Y-%m-%d %H:%M:%S')
-            sl[4] = Datetime
-            sl[0] = int(sl[0])
-            ### pop the unnecessary elements
-            sl.pop(5)
-            sl.pop(3)
-            ### append the time flag
-            sl.append(time_flag)
-            coordinates.append(sl)
-            ### sort coordinates by the Cast number
-            coordinates = sorted(coordinates, key=lambda x: x[0])
-    return coordinates
-
-def create_Dataset(cal_dir, config):
+    return [[c.cast, c.lat, c.lon, tools.datetime_string(c.datetime), c.time_flag]
+            for c in load_cal_casts(cal_dir)]
+
+def create_Dataset(cal_dir, config=None, ragged=False):
     """
     Create a xr.Dataset from the calibration data files in a directory.
 
@@ -119,8 +233,11 @@ def create_Dataset(cal_dir, config):
     ----------
     cal_dir : str
         The directory containing the .cal files.
-    config : dict
+    config : dict(optional)
         The configuration dictionary.
+    ragged : bool(optional)
+        Return the casts as a contiguous ragged array along OBS instead of padding them to a common PRES grid,
+        see ragged.to_ragged.
 
     Returns
     -------
@@ -130,22 +247,14 @@ def create_Dataset(cal_dir, config):
     if not isinstance(config, dict):
         config = tools.get_config()
 
-    cal_list = load_cal_from_file(cal_dir)
-    coordinates = create_coordinates(cal_dir)
-
-    nc_list = []
-    Cast = np.zeros(len(coordinates))
-    Lat = np.zeros(len(coordinates))
-    Lon = np.zeros(len(coordinates))
-    time_flag = np.zeros(len(coordinates))
-    for i in range(len(cal_list)):
-        cal_list[i].insert(loc=0, column='DATETIME', value=np.full(len(cal_list[i]),datetime.datetime.strptime(coordinates[i][3], '%Y-%m-%d %H:%M:%S')))
-        nc_list.append(cal_list[i].set_index(['DATETIME','pr']).to_xarray())
-        Cast[i] = coordinates[i][0]
-        Lat[i] = coordinates[i][1]
-        Lon[i] = coordinates[i][2]
-        time_flag[i] = coordinates[i][4]
-    ds = xr.concat(nc_list, dim='DATETIME') 
+    casts = load_cal_casts(cal_dir, config.get('io_threads', 1))
+
+    with instrumentation.stage('build', casts=len(casts)):
+        ds = tools.stack_casts([c.datetime for c in casts], [c.data for c in casts], column_names, 'pr')
+    Cast = np.array([c.cast for c in casts], dtype=float)
+    Lat = np.array([c.lat for c in casts])
+    Lon = np.array([c.lon for c in casts])
+    time_flag = np.array([c.time_flag for c in casts], dtype=float)
 
     ### assign Longitude, Latitude as coordinates and the Cast number as a variable
     ds.coords['latitude'] = ('DATETIME', Lat)
@@ -165,12 +274,14 @@ def create_Dataset(cal_dir, config):
     ds,_ = process_dataset(ds, config)
     ### sort the dataset by longitude
     ds = ds.sortby('LONGITUDE')
+    if ragged:
+        ds = ragged_arrays.to_ragged(ds, 'PRES')
 
     return ds
 
 
 
-def create_complete_Dataset(directory_list):
+def create_complete_Dataset(directory_list, config=None, workers=1):
     """
     Create a xr.Dataset from a list of directories containing calibration data files.
 
@@ -178,14 +289,21 @@ def create_complete_Dataset(directory_list):
     ----------
     directory_list : list
         A list of directories containing the .cal files.
+    config : dict(optional)
+        The configuration dictionary.
+    workers : int(optional)
+        The number of worker processes creating the datasets of the directories in parallel.
         
     Returns
     -------
     xr.Dataset
         The dataset containing the calibration data.
     """
-    ds_list = []
-    for directory in directory_list:
-        ds_list.append(create_Dataset(directory))
-    ds = xr.concat(ds_list, dim='DATETIME')
-    return ds
\ No newline at end of file
+    if not isinstance(config, dict):
+        config = tools.get_config()
+    if workers == 1:
+        ds_list = [create_Dataset(directory, config) for directory in directory_list]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            ds_list = list(pool.map(create_Dataset, directory_list, itertools.repeat(config)))
+    return xr.concat(ds_list, dim='DATETIME')
@@ -3,11 +3,240 @@ import pandas as pd
 import os
 import xarray as xr
 import datetime
+import collections
+import concurrent.futures
+import itertools
+import io
+import mmap
 from WBTSdata.convert import process_dataset
+from WBTSdata import tools, instrumentation, ragged as ragged_arrays
 
 column_names = ['z_depth', 'u_water_velocity_component', 'v_water_velocity_component', 'error_velocity']
 units = ['meters', 'cm_per_s', 'cm_per_s', 'cm_per_s']
 
+VelPosition = collections.namedtuple('VelPosition', ['datetime', 'lat', 'lon'])
+VelHeader = collections.namedtuple('VelHeader', ['cast', 'configuration', 'avg', 'start', 'end'])
+VelCast = collections.namedtuple('VelCast', ['header', 'data'])
+
+header_lines = 74
+### line numbers (0-based) of the header fields
+cast_line = 21
+configuration_line = 19
+position_lines = {'avg': 25, 'start': 35, 'end': 45}
+
+
+def parse_vel_header(buf):
+    """
+    Parse the fixed 74-line LADCP header of a .vel file from a single buffer.
+
+    Only the header lines are split, the velocity table is returned as a view into buf.
+
+    Parameters
+    ----------
+    buf : bytes or mmap.mmap
+        The content of the .vel file.
+
+    Returns
+    -------
+    VelHeader
+        The Cast number, the configuration and the average, start and end VelPosition of the cast.
+    memoryview
+        A zero-copy view of the velocity table following the header.
+    """
+    lines = []
+    pos = 0
+    for _ in range(header_lines):
+        end = buf.find(b'\n', pos)
+        if end < 0:
+            raise ValueError(f"LADCP header is shorter than {header_lines} lines")
+        lines.append(buf[pos:end])
+        pos = end + 1
+
+    def field(i):
+        return lines[i].decode('utf-8').split()[-1]
+
+    long_Cast_number = field(cast_line)
+    if long_Cast_number[-1] == 'N' or long_Cast_number[-1] == 'S':
+        Cast = int(long_Cast_number[-4:-1])
+    else:
+        Cast = int(long_Cast_number[-3:])
+
+    positions = {}
+    for name, i in position_lines.items():
+        date_time = datetime.datetime.strptime(field(i+2) + field(i+3), '%m/%d/%y%H:%M:%S')
+        positions[name] = VelPosition(date_time, float(field(i)), float(field(i+1)))
+
+    header = VelHeader(Cast, field(configuration_line), **positions)
+    return header, memoryview(buf)[pos:]
+
+def parse_vel_table(body):
+    """
+    Parse the velocity table of a .vel file.
+
+    A file-like body is read by the parser in chunks, so the table is not copied as a whole, e.g. a memory map or
+    an io.BytesIO of the file content positioned at the start of the table, see table_stream.
+
+    Parameters
+    ----------
+    body : bytes-like or file-like
+        The velocity table as returned by parse_vel_header, or a stream positioned at its start.
+
+    Returns
+    -------
+    np.ndarray
+        The velocity data with one column per entry in column_names.
+    """
+    if not hasattr(body, 'read'):
+        body = io.BytesIO(body)
+    return pd.read_csv(body, names=column_names, sep=r'\s+', encoding='utf-8').to_numpy(dtype=float)
+
+def table_stream(buf, body):
+    """
+    Get a stream over the velocity table of a .vel file without copying it.
+
+    Parameters
+    ----------
+    buf : bytes or mmap.mmap
+        The content of the .vel file.
+    body : memoryview
+        The view of the table as returned by parse_vel_header, which is released.
+
+    Returns
+    -------
+    io.BytesIO or mmap.mmap
+        A stream positioned at the start of the table. An io.BytesIO shares the bytes of buf, the map is buf itself.
+    """
+    offset = len(buf) - len(body)
+    body.release()
+    ### io.BytesIO only copies its initial bytes when they are modified
+    stream = buf if isinstance(buf, mmap.mmap) else io.BytesIO(buf)
+    stream.seek(offset)
+    return stream
+
+def parse_vel_file(buf):
+    """
+    Parse the content of a single .vel file, the header and the velocity table from one buffer.
+
+    Parameters
+    ----------
+    buf : bytes
+        The content of the .vel file.
+
+    Returns
+    -------
+    VelCast
+        The header and the velocity data of the cast.
+    """
+    header, body = parse_vel_header(buf)
+    return VelCast(header, parse_vel_table(table_stream(buf, body)))
+
+def read_vel_file(path, use_mmap=False):
+    """
+    Read a single .vel file, parsing the header and the velocity table from one buffer.
+
+    Parameters
+    ----------
+    path : str
+        The path to the .vel file.
+    use_mmap : bool(optional)
+        Memory-map the file instead of reading it into memory.
+
+    Returns
+    -------
+    VelCast
+        The header and the velocity data of the cast.
+    """
+    with open(path, 'rb') as file:
+        if not use_mmap:
+            return parse_vel_file(file.read())
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            header, body = parse_vel_header(buf)
+            ### the parser reads the table from the map in chunks, the view is released so the map can be closed
+            data = parse_vel_table(table_stream(buf, body))
+    return VelCast(header, data)
+
+def read_vel_header(path):
+    """
+    Read the header of a single .vel file without reading the velocity table.
+
+    Parameters
+    ----------
+    path : str
+        The path to the .vel file.
+
+    Returns
+    -------
+    VelHeader
+        The Cast number, the configuration and the average, start and end VelPosition of the cast.
+    """
+    with open(path, 'rb') as file:
+        buf = b''.join(file.readline() for _ in range(header_lines))
+    ### the last header line may lack the newline if the file has no velocity table
+    if not buf.endswith(b'\n'):
+        buf += b'\n'
+    return parse_vel_header(buf)[0]
+
+def load_vel_casts(vel_dir, use_mmap=False, threads=1):
+    """
+    Read all .vel files in the directory vel_dir, opening every file once.
+
+    Parameters
+    ----------
+    vel_dir : str
+        The directory containing the velocity data files.
+    use_mmap : bool(optional)
+        Memory-map the files instead of reading them into memory, the files are then read one after the other.
+    threads : int(optional)
+        The maximum number of files read at once, see tools.read_files. The files are parsed in order.
+
+    Returns
+    -------
+    list
+        A list of VelCast records sorted by the Cast number.
+    """
+    paths = [os.path.join(vel_dir, f) for f in os.listdir(vel_dir) if f.endswith('.vel')]
+    ### the header and the table of a .vel file are parsed together
+    with instrumentation.stage('parse_bodies', casts=len(paths), bytes=0) as record:
+        if use_mmap:
+            ### the mapped files are read one after the other anyway
+            record['bytes'] = instrumentation.files_size(paths)
+            casts = [read_vel_file(path, use_mmap) for path in paths]
+        else:
+            casts = []
+            ### the bytes are counted as the files are read, a stat of every file up front would be a serial round trip
+            for buf in tools.read_files(paths, threads):
+                record['bytes'] += len(buf)
+                casts.append(parse_vel_file(buf))
+    ### sort the casts by the Cast number
+    casts.sort(key=lambda x: x.header.cast)
+    return casts
+
+def load_vel_headers(vel_dir, threads=1):
+    """
+    Read the headers of all .vel files in the directory vel_dir without parsing the velocity tables.
+
+    Parameters
+    ----------
+    vel_dir : str
+        The directory containing the velocity data files.
+    threads : int(optional)
+        The maximum number of headers read at once.
+
+    Returns
+    -------
+    list
+        A list of VelHeader records sorted by the Cast number.
+    """
+    vel_files = [f for f in os.listdir(vel_dir) if f.endswith('.vel')]
+    paths = [os.path.join(vel_dir, vel_file) for vel_file in vel_files]
+    if threads <= 1:
+        headers = [read_vel_header(path) for path in paths]
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+            headers = list(pool.map(read_vel_header, paths))
+    headers.sort(key=lambda x: x.cast)
+    return headers
+
 def load_vel_from_file(vel_dir):
     """
     Load the velocity data from the files in the directory vel_dir.
@@ -21,15 +250,9 @@ def load_vel_from_file(vel_dir):
     Returns
     -------
     list
-        A list of pandas DataFrames containing the velocity data.
+        A list of pandas DataFrames containing the velocity data, sorted by the Cast number.
     """
-    vel_files = [f for f in os.listdir(vel_dir) if f.endswith('.vel')]
-    vel_list = []
-    ### sort the files by the Cast number
-    vel_files = sorted(vel_files, key=lambda x: int(x[7:9]))
-    for vel_file in vel_files:
-        vel_list.append(pd.read_csv(os.path.join(vel_dir, vel_file),names=column_names, skiprows=74, sep='\s+', encoding='utf-8'))
-    return vel_list
+    return [pd.DataFrame(c.data, columns=column_names) for c in load_vel_casts(vel_dir)]
 
 def create_coordinates(vel_dir):
     '''
@@ -44,46 +267,20 @@ def create_coordinates(vel_dir):
     Returns
     -------
     list
-        A list of coordinates for the average, start, and end of the cast.
+        A list of coordinates for the average, start, and end of the cast. Each coordinate is a list of the
+        Cast number, configuration, datetime string, latitude and longitude, with the latitude and longitude
+        as floats, not the strings of the header.
     '''
-    vel_files = [f for f in os.listdir(vel_dir) if f.endswith('.vel')]
-
     avg_coordinates = []
     start_coordinates = []
     end_coordinates = []
-    for i in vel_files:
-        with open(vel_dir +'/'+ i, 'rb') as file:
-            file_content = file.read()
-            long_Cast_number = file_content.splitlines()[21].decode('utf-8').split()[-1]
-            if long_Cast_number[-1] == 'N' or long_Cast_number[-1] == 'S':
-                Cast = int(long_Cast_number[-4:-1])
-            else:
-                Cast = int(long_Cast_number[-3:])
-
-            Configuration = file_content.splitlines()[19].decode('utf-8').split()[-1]
-            for i in [25,35,45]:
-                lat = file_content.splitlines()[i].decode('utf-8').split()[-1]
-                lon = file_content.splitlines()[i+1].decode('utf-8').split()[-1]
-                date = file_content.splitlines()[i+2].decode('utf-8').split()[-1]
-                time = file_content.splitlines()[i+3].decode('utf-8').split()[-1]
-                date_time = datetime.datetime.strptime(date + time, '%m/%d/%y%H:%M:%S').strftime('%Y-%m-%d %H:%M:%S')
-                if i == 25:
-                    avg_values = [Cast,Configuration,date_time,lat,lon]
-                elif i == 35:
-                    start_values = [Cast,Configuration,date_time,lat,lon]
-                else:
-                    end_values = [Cast,Configuration,date_time,lat,lon]
-
-        avg_coordinates.append(avg_values)
-        start_coordinates.append(start_values)
-        end_coordinates.append(end_values)
-        ### sort the list by the Cast number
-        avg_coordinates = sorted(avg_coordinates, key=lambda x: x[0])
-        start_coordinates = sorted(start_coordinates, key=lambda x: x[0])
-        end_coordinates = sorted(end_coordinates, key=lambda x: x[0])
+    for header in load_vel_headers(vel_dir):
+        for position, coordinates in zip([header.avg, header.start, header.end], [avg_coordinates, start_coordinates, end_coordinates]):
+            date_time = position.datetime.strftime('%Y-%m-%d %H:%M:%S')
+            coordinates.append([header.cast, header.configuration, date_time, position.lat, position.lon])
     return avg_coordinates, start_coordinates, end_coordinates
 
-def create_Dataset(vel_dir, config=None):
+def create_Dataset(vel_dir, config=None, ragged=False):
     """
     Create a xr.Dataset from the velocity data files in the directory vel_dir.
 
@@ -93,6 +290,9 @@ def create_Dataset(vel_dir, config=None):
         The directory containing the velocity data files.
     config : dict(optional)
         The configuration dictionary.
+    ragged : bool(optional)
+        Return the casts as a contiguous ragged array along OBS instead of padding them to a common DEPTH grid,
+        see ragged.to_ragged.
         
     Returns
     -------
@@ -101,23 +301,15 @@ def create_Dataset(vel_dir, config=None):
     """
     if not isinstance(config, dict):
         config = tools.get_config()
-    vel_list = load_vel_from_file(vel_dir)
-    avg_coords, start_coords, end_coords = create_coordinates(vel_dir)
-    coordinates = start_coords
+    casts = load_vel_casts(vel_dir, threads=config.get('io_threads', 1))
 
-    Cast = np.zeros(len(coordinates))
-    Lat = np.zeros(len(coordinates))
-    Lon = np.zeros(len(coordinates))
-    
-    nc_list = []
-    for i in range(len(vel_list)):
-        vel_list[i].insert(loc=0, column='DATETIME', value=np.full(len(vel_list[i]),datetime.datetime.strptime(coordinates[i][2], '%Y-%m-%d %H:%M:%S')))
-        #nc_list.append(vel_list[i].to_xarray())
-        nc_list.append(vel_list[i].set_index(['DATETIME','z_depth']).to_xarray())
-        Cast[i] = coordinates[i][0]
-        Lat[i] = coordinates[i][3]
-        Lon[i] = coordinates[i][4]
-    ds = xr.concat(nc_list, dim='DATETIME')
+    ### use the start of the cast as its position and time
+    starts = [c.header.start for c in casts]
+    with instrumentation.stage('build', casts=len(casts)):
+        ds = tools.stack_casts([p.datetime for p in starts], [c.data for c in casts], column_names, 'z_depth')
+    Cast = np.array([c.header.cast for c in casts], dtype=float)
+    Lat = np.array([p.lat for p in starts])
+    Lon = np.array([p.lon for p in starts])
     ds.coords['latitude'] = ('DATETIME', Lat)
     ds.coords['longitude'] = ('DATETIME', Lon)
     ds = ds.assign({'CAST': ('DATETIME', Cast)})
@@ -134,10 +326,12 @@ def create_Dataset(vel_dir, config=None):
     ds,_ = process_dataset(ds, config)
     ### sort the dataset by longitude
     ds = ds.sortby('LONGITUDE')
+    if ragged:
+        ds = ragged_arrays.to_ragged(ds, 'DEPTH')
 
     return ds
 
-def create_complete_Dataset(directory_list):
+def create_complete_Dataset(directory_list, config=None, workers=1):
     """
     Create a xr.Dataset from the velocity data files in the list of directories directory_list.
 
@@ -145,13 +339,21 @@ def create_complete_Dataset(directory_list):
     ----------
     directory_list : list
         A list of directories containing the velocity data files.
+    config : dict(optional)
+        The configuration dictionary.
+    workers : int(optional)
+        The number of worker processes creating the datasets of the directories in parallel.
 
     Returns
     -------
     xr.Dataset
         A xr.Dataset containing the velocity data.
     """
-    ds_list = []
-    for vel_dir in directory_list:
-        ds_list.append(create_Dataset(vel_dir))
+    if not isinstance(config, dict):
+        config = tools.get_config()
+    if workers == 1:
+        ds_list = [create_Dataset(vel_dir, config) for vel_dir in directory_list]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            ds_list = list(pool.map(create_Dataset, directory_list, itertools.repeat(config)))
     return xr.concat(ds_list, dim='DATETIME')
@@ -0,0 +1,194 @@
+import os
+import json
+import hashlib
+import importlib.metadata
+
+manifest_name = 'build_manifest.json'
+
+
+def package_version():
+    '''
+    Get the installed version of WBTSdata.
+
+    Returns
+    -------
+    str
+        The version string, 'unknown' if the package is not installed.
+    '''
+    try:
+        return importlib.metadata.version('WBTSdata')
+    except importlib.metadata.PackageNotFoundError:
+        return 'unknown'
+
+def file_hash(path, block_size=2**20):
+    '''
+    Compute the sha256 hash of a file.
+
+    Parameters
+    ----------
+    path : str
+        The path to the file
+    block_size : int(optional)
+        The number of bytes read at once
+
+    Returns
+    -------
+    str
+        The hex digest of the file content
+    '''
+    h = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def config_hash(section):
+    '''
+    Compute a hash of a section of the configuration.
+
+    Parameters
+    ----------
+    section : dict
+        The configuration section, e.g. config['GC_2009_04']
+
+    Returns
+    -------
+    str
+        The hex digest of the section
+    '''
+    return hashlib.sha256(json.dumps(section, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def fingerprint_files(paths, previous=None):
+    '''
+    Record size, modification time and hash of the input files.
+
+    Files whose size and modification time match the previous fingerprint are not hashed again.
+
+    Parameters
+    ----------
+    paths : list
+        The paths to the input files
+    previous : dict(optional)
+        The fingerprint of the files recorded by an earlier build
+
+    Returns
+    -------
+    dict
+        A dictionary with the path as key and a dictionary with 'size', 'mtime' and 'sha256' as value
+    '''
+    previous = previous or {}
+    fingerprint = {}
+    for path in paths:
+        stat = os.stat(path)
+        old = previous.get(path)
+        if old is not None and old['size'] == stat.st_size and old['mtime'] == stat.st_mtime_ns:
+            fingerprint[path] = old
+        else:
+            fingerprint[path] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': file_hash(path)}
+    return fingerprint
+
+def list_inputs(directory, extension):
+    '''
+    List the raw files of a cruise directory.
+
+    Parameters
+    ----------
+    directory : str
+        The directory containing the raw files, or None
+    extension : str
+        The file extension, '.cal' or '.vel'
+
+    Returns
+    -------
+    list
+        The sorted paths of the files
+    '''
+    if directory is None:
+        return []
+    return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(extension))
+
+def create_entry(inputs, config_section, previous=None):
+    '''
+    Create the manifest entry of an output file.
+
+    Parameters
+    ----------
+    inputs : list
+        The paths to the raw files the output is created from
+    config_section : dict
+        The configuration section used for the output
+    previous : dict(optional)
+        The entry recorded by an earlier build, used to avoid hashing unchanged files
+
+    Returns
+    -------
+    dict
+        The entry with the fingerprint of the inputs, the package version and the hash of the configuration section
+    '''
+    previous_inputs = previous['inputs'] if previous else None
+    return {'inputs': fingerprint_files(inputs, previous_inputs),
+            'version': package_version(),
+            'config': config_hash(config_section)}
+
+def is_up_to_date(entry, previous, path):
+    '''
+    Check if an output file has to be created again.
+
+    Parameters
+    ----------
+    entry : dict
+        The entry of the output for the current inputs, as returned by create_entry
+    previous : dict
+        The entry recorded when the output was created, or None
+    path : str
+        The path to the output file
+
+    Returns
+    -------
+    bool
+        True if the output exists and neither its inputs, the package version nor the configuration section changed.
+    '''
+    if previous is None or not os.path.exists(path):
+        return False
+    ### the modification times may differ for copied files with the same content
+    hashes = lambda e: {p: f['sha256'] for p, f in e['inputs'].items()}
+    return (hashes(entry) == hashes(previous)
+            and entry['version'] == previous['version']
+            and entry['config'] == previous['config'])
+
+def load_manifest(output_dir):
+    '''
+    Load the build manifest stored in output_dir.
+
+    Parameters
+    ----------
+    output_dir : str
+        The directory the created files are stored in
+
+    Returns
+    -------
+    dict
+        The manifest with the output paths relative to output_dir as keys, empty if there is no manifest.
+    '''
+    path = os.path.join(output_dir, manifest_name)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as file:
+        return json.load(file)
+
+def save_manifest(manifest, output_dir):
+    '''
+    Save the build manifest in output_dir.
+
+    Parameters
+    ----------
+    manifest : dict
+        The manifest as returned by load_manifest
+    output_dir : str
+        The directory the created files are stored in
+    '''
+    path = os.path.join(output_dir, manifest_name)
+    ### write to a temporary file first, so an interrupted build does not leave a broken manifest
+    with open(path + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
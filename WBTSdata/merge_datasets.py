@@ -1,13 +1,12 @@
 import numpy as np
-import pandas as pd
 import os
 import xarray as xr
-import datetime
-from WBTSdata import load_vel_files, load_cal_files, tools, convert
+from WBTSdata import load_vel_files, load_cal_files, tools, convert, archive_index, regrid, instrumentation, cast_index
+from WBTSdata import ragged as ragged_arrays
 import glob
 
 
-def dir_list_CTD(input_dir):
+def dir_list_CTD(input_dir, index=None):
     '''
     create a list with all the directories that contain the CTD data
     
@@ -15,23 +14,19 @@ def dir_list_CTD(input_dir):
     ----------
     input_dir : str
         The path to the directory containing the CTD data
+    index : dict(optional)
+        An index of the archive as returned by archive_index.get_index, used instead of walking input_dir
 
     Returns
     -------
     dir_list_CTD : list
         A list of strings, each string is a path to a directory containing CTD data
     '''
-    dir_list_CTD = []
-    for root, dirs,files in os.walk(input_dir):
-        if 'CTD' in dirs: 
-            dir_list_CTD.append(os.path.join(root, 'CTD'))
-    dir_list_CTD.sort()
-    for i in dir_list_CTD:
-        if 'Created_files' in i:
-            dir_list_CTD.remove(i)
-    return dir_list_CTD
+    if index is None:
+        index = archive_index.scan_archive(input_dir)
+    return list(archive_index.CTD_dirs(index))
 
-def dir_list_ADCP(input_dir):
+def dir_list_ADCP(input_dir, index=None):
     '''
     create a list with all the directories that contain the ADCP data
     
@@ -39,27 +34,116 @@ def dir_list_ADCP(input_dir):
     ----------
     input_dir : str
         The path to the directory containing the ADCP data
+    index : dict(optional)
+        An index of the archive as returned by archive_index.get_index, used instead of walking input_dir
         
     Returns
     -------
     dir_list_ADCP : list
         A list of strings, each string is a path to a directory containing ADCP data
     '''
-    dir_list_ADCP = []
-    for root, dirs,files in os.walk(input_dir):
-        if 'FINAL_ADCP_PRODUCTS' and 'ladcp_velfiles' in dirs: 
-            dir_list_ADCP.append(os.path.join(root, 'ladcp_velfiles'))
-        if 'FINAL_ADCP_PRODUCTS' and 'LADCP_velfiles' in dirs:
-            dir_list_ADCP.append(os.path.join(root, 'LADCP_velfiles'))
-    dir_list_ADCP.sort()
-    ### exclude the 2019_12 path since it is empty
-    for i in dir_list_ADCP:
-        if '2019_12' in i:
-            dir_list_ADCP.remove(i)
-    return dir_list_ADCP
+    if index is None:
+        index = archive_index.scan_archive(input_dir)
+    return list(archive_index.ADCP_dirs(index))
 
 
-def create_coordinates_with_ADCPtimes(cal_dir, input_dir=None):
+def find_ADCP_dir(cal_dir, adcp_dirs):
+    '''
+    Find the ADCP directory of the cruise of a CTD directory
+
+    Parameters
+    ----------
+    cal_dir : str
+        The path to the directory containing the CTD calibration data
+    adcp_dirs : list
+        The ADCP directories of the archive as returned by dir_list_ADCP
+
+    Returns
+    -------
+    vel_dir : str
+        The path to the directory containing the ADCP data, None if the cruise has no ADCP data
+    '''
+    year = cal_dir[-11:-4]
+    for j in adcp_dirs:
+        if year in j:
+            return j
+    return None
+
+def match_casts(casts_CTD, casts_ADCP):
+    '''
+    Join the CTD and ADCP casts of a cruise on the Cast number
+
+    Parameters
+    ----------
+    casts_CTD : list
+        The Cast numbers of the CTD casts
+    casts_ADCP : list
+        The Cast numbers of the ADCP casts
+
+    Returns
+    -------
+    matches : dict
+        The index of the matching ADCP cast for the index of every matched CTD cast
+    unmatched_CTD : list
+        The Cast numbers of the CTD casts without ADCP cast
+    unmatched_ADCP : list
+        The Cast numbers of the ADCP casts without CTD cast
+    '''
+    index_ADCP = {Cast: j for j, Cast in enumerate(casts_ADCP)}
+    matches = {i: index_ADCP[Cast] for i, Cast in enumerate(casts_CTD) if Cast in index_ADCP}
+    matched = set(casts_CTD)
+    unmatched_CTD = [Cast for i, Cast in enumerate(casts_CTD) if i not in matches]
+    unmatched_ADCP = [Cast for Cast in casts_ADCP if Cast not in matched]
+    return matches, unmatched_CTD, unmatched_ADCP
+
+def ADCP_times(cal_dir, casts, input_dir=None, vel_dir=None, adcp_dirs=None, threads=1):
+    '''
+    Get the times of the CTD casts of a cruise from the start times of the corresponding ADCP casts
+
+    Parameters
+    ----------
+    cal_dir : str
+        The path to the directory containing the CTD calibration data
+    casts : list
+        The CalCast records of cal_dir
+    input_dir : str(optional)
+        The path to the directory containing the CTD data
+    vel_dir : str(optional)
+        The path to the directory containing the ADCP data of the cruise. If not given, it is
+        looked up in adcp_dirs
+    adcp_dirs : list(optional)
+        The ADCP directories of the archive as returned by dir_list_ADCP, to avoid walking input_dir again
+    threads : int(optional)
+        The maximum number of files read at once, see tools.read_files
+
+    Returns
+    -------
+    times : np.ndarray
+        The datetime64[s] of the ADCP cast of every CTD cast, or of the CTD cast for casts without ADCP data
+    '''
+    if vel_dir is None:
+        if adcp_dirs is None:
+            if not isinstance(input_dir, str):
+                config = tools.get_config()
+                input_dir = config['input_dir']
+            adcp_dirs = dir_list_ADCP(input_dir)
+        vel_dir = find_ADCP_dir(cal_dir, adcp_dirs)
+
+    times = np.array([c.datetime for c in casts], dtype='datetime64[s]')
+    if vel_dir is None:
+        print(f"Warning: No ADCP data for {cal_dir}, the CTD times are used.")
+        return times
+    headers = load_vel_files.load_vel_headers(vel_dir, threads)
+    matches, unmatched_CTD, unmatched_ADCP = match_casts([c.cast for c in casts], [h.cast for h in headers])
+    for i, j in matches.items():
+        times[i] = np.datetime64(headers[j].start.datetime, 's')
+    if unmatched_CTD:
+        print(f"Warning: CTD casts without ADCP cast in {vel_dir}: {unmatched_CTD}")
+    if unmatched_ADCP:
+        print(f"Warning: ADCP casts without CTD cast in {cal_dir}: {unmatched_ADCP}")
+    return times
+
+def create_coordinates_with_ADCPtimes(cal_dir, input_dir=None, casts=None, vel_dir=None, adcp_dirs=None, threads=1):
     '''
     Create a list of coordinates for the CTD data with the corresponding ADCP times
     
@@ -69,6 +153,15 @@ def create_coordinates_with_ADCPtimes(cal_dir, input_dir=None):
         The path to the directory containing the CTD calibration data
     input_dir : str
         The path to the directory containing the CTD data
+    casts : list(optional)
+        The CalCast records of cal_dir, if they have already been read
+    vel_dir : str(optional)
+        The path to the directory containing the ADCP data of the cruise. If not given, it is
+        looked up in adcp_dirs
+    adcp_dirs : list(optional)
+        The ADCP directories of the archive as returned by dir_list_ADCP, to avoid walking input_dir again
+    threads : int(optional)
+        The maximum number of files read at once, see tools.read_files
     
     Returns
     -------
@@ -77,29 +170,15 @@ def create_coordinates_with_ADCPtimes(cal_dir, input_dir=None):
             - Cast number
             - Latitude
             - Longitude
-            - Date and time of the ADCP data
+            - Date and time of the ADCP data, or of the CTD data for casts without ADCP data, see ADCP_times
             - Time flag
     '''
-    if not isinstance(input_dir, str):
-        config = tools.get_config()
-        input_dir = config['input_dir']
-    year = cal_dir[-11:-4]
-    for j in dir_list_ADCP(input_dir):
-        if year in j:
-            _,coords_ADCP,_ = load_vel_files.create_coordinates(j)
-            coords_CTD = load_cal_files.create_coordinates(cal_dir)
-            for coords_i in coords_ADCP:
-                Cast = coords_i[0] 
-                for coords_j in coords_CTD:
-                    if Cast == coords_j[0]:
-                        coords_j[3] = coords_i[2]
-                        break
-                    else:
-                        continue
-            coordinates = coords_CTD
-    return coordinates
-
-def create_CTD_Dataset_with_ADCPtimes(cal_dir, config=None):
+    if casts is None:
+        casts = load_cal_files.load_cal_casts(cal_dir, threads)
+    times = ADCP_times(cal_dir, casts, input_dir, vel_dir, adcp_dirs, threads)
+    return [[c.cast, c.lat, c.lon, tools.datetime_string(t), c.time_flag] for c, t in zip(casts, times)]
+
+def create_CTD_Dataset_with_ADCPtimes(cal_dir, config=None, vel_dir=None, adcp_dirs=None):
     """
     Create a CTD dataset with the corresponding ADCP times.
 
@@ -109,6 +188,10 @@ def create_CTD_Dataset_with_ADCPtimes(cal_dir, config=None):
         The path to the directory containing the CTD calibration data
     config : dict(optional)
         The configuration dictionary
+    vel_dir : str(optional)
+        The path to the directory containing the ADCP data of the cruise
+    adcp_dirs : list(optional)
+        The ADCP directories of the archive, used if vel_dir is not given
 
     Returns
     -------
@@ -117,22 +200,16 @@ def create_CTD_Dataset_with_ADCPtimes(cal_dir, config=None):
     """
     if not isinstance(config, dict):
         config = tools.get_config()
-    cal_list = load_cal_files.load_cal_from_file(cal_dir)
-    coordinates = create_coordinates_with_ADCPtimes(cal_dir)
-
-    nc_list = []
-    Cast = np.zeros(len(coordinates))
-    Lat = np.zeros(len(coordinates))
-    Lon = np.zeros(len(coordinates))
-    time_flag = np.zeros(len(coordinates))
-    for i in range(len(cal_list)):
-        cal_list[i].insert(loc=0, column='DATETIME', value=np.full(len(cal_list[i]),datetime.datetime.strptime(coordinates[i][3], '%Y-%m-%d %H:%M:%S')))
-        nc_list.append(cal_list[i].set_index(['DATETIME','pr']).to_xarray())
-        Cast[i] = coordinates[i][0]
-        Lat[i] = coordinates[i][1]
-        Lon[i] = coordinates[i][2]
-        time_flag[i] = coordinates[i][4]
-    ds = xr.concat(nc_list, dim='DATETIME')
+    threads = config.get('io_threads', 1)
+    casts = load_cal_files.load_cal_casts(cal_dir, threads)
+    times = ADCP_times(cal_dir, casts, config.get('input_dir'), vel_dir, adcp_dirs, threads)
+
+    with instrumentation.stage('build', casts=len(casts)):
+        ds = tools.stack_casts(times, [c.data for c in casts], load_cal_files.column_names, 'pr')
+    Cast = np.array([c.cast for c in casts], dtype=float)
+    Lat = np.array([c.lat for c in casts])
+    Lon = np.array([c.lon for c in casts])
+    time_flag = np.array([c.time_flag for c in casts], dtype=float)
     ### assign Longitude, Latitude as coordinates and the Cast number as a variable
     ds.coords['latitude'] = ('DATETIME', Lat)
     ds.coords['longitude'] = ('DATETIME', Lon)
@@ -151,7 +228,7 @@ def create_CTD_Dataset_with_ADCPtimes(cal_dir, config=None):
 
 
 
-def merge_datasets(cal_dir, vel_dir, config=None):
+def merge_datasets(cal_dir, vel_dir, config=None, ragged=False, depth_grid=None, max_gap=None):
     """
     Merge the CTD and ADCP datasets.
     
@@ -161,6 +238,15 @@ def merge_datasets(cal_dir, vel_dir, config=None):
         The path to the directory containing the CTD calibration data
     vel_dir : str
         The path to the directory containing the ADCP data
+    ragged : bool(optional)
+        Return the casts as a contiguous ragged array along OBS, keeping only the depths with CTD or ADCP data,
+        see ragged.to_ragged
+    depth_grid : np.ndarray(optional)
+        Interpolate the CTD and ADCP casts onto these DEPTH levels in m instead of merging them on the union of
+        their levels, with the depth of the CTD data computed from the pressure, see regrid.regrid.
+        regrid.standard_grid(config) returns the grid of the configuration.
+    max_gap : float(optional)
+        With depth_grid, levels between two observations further apart than max_gap are set to NaN
 
     Returns
     -------
@@ -172,7 +258,10 @@ def merge_datasets(cal_dir, vel_dir, config=None):
 
     if vel_dir == None:
         ds_CTD = load_cal_files.create_Dataset(cal_dir, config)
-        ds_CTD = ds_CTD.rename({'PRES': 'DEPTH'})
+        if depth_grid is not None:
+            ds_CTD = regrid.regrid(ds_CTD, depth_grid, 'PRES', max_gap)
+        else:
+            ds_CTD = ds_CTD.rename({'PRES': 'DEPTH'})
         ### add the ADCP variables with nan values to the dataset and delete all variable attributes
         for i in ['u_water_velocity_component', 'v_water_velocity_component', 'error_velocity']:
             ds_CTD[i] = xr.full_like(ds_CTD['TEMP'], fill_value=np.nan)
@@ -180,18 +269,93 @@ def merge_datasets(cal_dir, vel_dir, config=None):
         ds_merge,_ = convert.process_dataset(ds_CTD, config)
 
     else:
-        ds_CTD = create_CTD_Dataset_with_ADCPtimes(cal_dir, config)
+        ds_CTD = create_CTD_Dataset_with_ADCPtimes(cal_dir, config, vel_dir=vel_dir)
         ds_ADCP = load_vel_files.create_Dataset(vel_dir, config)
-        ## change coordinates name of PRES to DEPTH for ADCP data
-        ds_CTD = ds_CTD.rename({'PRES': 'DEPTH'})
+        if depth_grid is not None:
+            ### put both datasets on the same DEPTH levels, so the merged dataset is not padded to their union
+            ds_CTD = regrid.regrid(ds_CTD, depth_grid, 'PRES', max_gap)
+            ds_ADCP = regrid.regrid(ds_ADCP, depth_grid, 'DEPTH', max_gap)
+        else:
+            ## change coordinates name of PRES to DEPTH for ADCP data
+            ds_CTD = ds_CTD.rename({'PRES': 'DEPTH'})
         ## merge the two datasets
-        ds_merge = xr.merge([ds_CTD, ds_ADCP], compat='override')
+        with instrumentation.stage('merge', casts=ds_CTD.sizes['DATETIME']):
+            ds_merge = xr.merge([ds_CTD, ds_ADCP], compat='override')
         ### change their attributes
         ds_merge.attrs['title'] = 'CTD and LADCP data of the Abaco Cruise'
         ds_merge.attrs['platform'] = 'CTD and Lowered Acoustic Doppler Current Profilers (LADCP)'
+    if ragged:
+        ds_merge = ragged_arrays.to_ragged(ds_merge, 'DEPTH')
     return ds_merge
     
-def merge_years(merge_dir):
+def merged_files(merge_dir):
+    '''
+    List the merged files of the individual cruises
+
+    Parameters
+    ----------
+    merge_dir : str
+        The path to the directory containing the merged datasets of different years
+
+    Returns
+    -------
+    list
+        The sorted paths to the merged files, excluding files of all years. The file with contiguous ragged
+        arrays of a cruise is only listed if the cruise has no padded file.
+    '''
+    files = glob.glob(os.path.join(merge_dir, 'Merged', '*.nc'))
+    files = [f for f in files if 'all_years' not in os.path.basename(f)]
+    padded = set(f for f in files if not f.endswith('_ragged.nc'))
+    return sorted(f for f in files if f in padded or f[:-len('_ragged.nc')] + '.nc' not in padded)
+
+def summarise_dataset(ds):
+    '''
+    Summarise the extent of a merged dataset, reading only its coordinates
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The merged dataset of one year
+
+    Returns
+    -------
+    dict
+        The minimum and maximum of DEPTH, LATITUDE, LONGITUDE and DATETIME
+    '''
+    summary = {}
+    for var in ['DEPTH', 'LATITUDE', 'LONGITUDE', 'DATETIME']:
+        values = ds[var].values
+        summary[var] = (values.min(), values.max())
+    return summary
+
+def attrs_from_summaries(summaries):
+    '''
+    Compute the global attributes of the dataset of all years from the summaries of the merged files
+
+    Parameters
+    ----------
+    summaries : list
+        The summaries as returned by summarise_dataset
+
+    Returns
+    -------
+    dict
+        The geospatial and time attributes
+    '''
+    extent = lambda var, i: [s[var][i] for s in summaries]
+    attrs = {}
+    attrs['geospatial_vertical_max'] = np.max(extent('DEPTH', 1))
+    attrs['geospatial_vertical_min'] = np.min(extent('DEPTH', 0))
+    attrs['geospatial_lat_min'] = np.min(extent('LATITUDE', 0))
+    attrs['geospatial_lat_max'] = np.max(extent('LATITUDE', 1))
+    attrs['geospatial_lon_min'] = np.min(extent('LONGITUDE', 0))
+    attrs['geospatial_lon_max'] = np.max(extent('LONGITUDE', 1))
+    attrs['time_cruise_start'] = str(np.min(extent('DATETIME', 0)).astype('datetime64[D]'))
+    attrs['time_cruise_end'] = str(np.max(extent('DATETIME', 1)).astype('datetime64[D]'))
+    attrs['sections'] = "Abaco, Northwest Providence Channel and 27N Florida Straits Sections"
+    return attrs
+
+def merge_years(merge_dir, lazy=False, chunks=None):
     '''
     Merge the datasets of different years into one dataset
     
@@ -199,33 +363,76 @@ def merge_years(merge_dir):
     ----------
     merge_dir : str
         The path to the directory containing the merged datasets of different years
+    lazy : bool(optional)
+        Open the files as dask arrays instead of loading all years into memory (requires dask)
+    chunks : dict(optional)
+        The chunks of the dask arrays if lazy is True, defaults to one chunk per file
         
     Returns
     -------
     ds_all : xarray.Dataset
-        The dataset containing the merged data of all years
+        The dataset containing the merged data of all years, padded to a common DEPTH grid
     '''
-    merged_files = glob.glob(os.path.join(merge_dir, 'Merged', '*.nc'))
-
     processed_datasets = []
-    for file1 in merged_files:
-        ds_new = xr.open_dataset(file1)
+    summaries = []
+    for file1 in merged_files(merge_dir):
+        ds_new = xr.open_dataset(file1, chunks=chunks or {}) if lazy else xr.open_dataset(file1)
+        ### files with contiguous ragged arrays are padded, which loads them into memory
+        if 'rowSize' in ds_new:
+            ds_new = ragged_arrays.to_padded(ds_new)
         if ds_new:
             processed_datasets.append(ds_new)
+            summaries.append(summarise_dataset(ds_new))
         else:
-            print(f"Warning: Dataset for dive number {ds.attrs['dive_number']} is empty or invalid.")
-    concatenated_ds = xr.concat(processed_datasets, dim='DATETIME')
-    ds_all = concatenated_ds.sortby('DATETIME')
-    ds_all.attrs['geospatial_vertical_max'] = ds_all['DEPTH'].max().values
-    ds_all.attrs['geospatial_vertical_min'] = ds_all['DEPTH'].min().values
-    ds_all.attrs['geospatial_lat_min'] = ds_all['LATITUDE'].min().values
-    ds_all.attrs['geospatial_lat_max'] = ds_all['LATITUDE'].max().values
-    ds_all.attrs['geospatial_lon_min'] = ds_all['LONGITUDE'].min().values
-    ds_all.attrs['geospatial_lon_max'] = ds_all['LONGITUDE'].max().values
-    ds_all.attrs['time_cruise_start'] = str(ds_all['DATETIME'].min().values.astype('datetime64[D]'))
-    ds_all.attrs['time_cruise_end'] = str(ds_all['DATETIME'].max().values.astype('datetime64[D]'))
-    ds_all.attrs['sections'] = "Abaco, Northwest Providence Channel and 27N Florida Straits Sections"
+            print(f"Warning: Dataset {file1} is empty or invalid.")
+    ### sort the datasets by time, so that sorting each dataset by DATETIME sorts the whole dataset
+    order = np.argsort([s['DATETIME'][0] for s in summaries], kind='stable')
+    processed_datasets = [processed_datasets[i] for i in order]
+
+    if lazy:
+        ### only concatenate along DATETIME and pad the DEPTH dimension lazily, without comparing the variables
+        processed_datasets = [ds.sortby('DATETIME') for ds in processed_datasets]
+        ds_all = xr.concat(processed_datasets, dim='DATETIME', data_vars='minimal', coords='minimal',
+                           compat='override', join='outer')
+    else:
+        concatenated_ds = xr.concat(processed_datasets, dim='DATETIME')
+        ds_all = concatenated_ds.sortby('DATETIME')
+    ds_all.attrs.update(attrs_from_summaries(summaries))
     return ds_all
 
+def write_all_years(merge_dir, path=None, chunks=None, pack=False):
+    '''
+    Merge the datasets of different years lazily and write them chunk by chunk, keeping only a few chunks in memory.
+    Without dask, all years are loaded into memory and written at once. The cast index of the file is saved next
+    to it, see cast_index.select_casts.
 
+    Parameters
+    ----------
+    merge_dir : str
+        The path to the directory containing the merged datasets of different years
+    path : str(optional)
+        The path of the file, defaults to 'Merged/WBTS_all_years_CTD_LADCP.nc' in merge_dir
+    chunks : dict(optional)
+        The chunks of the dask arrays, defaults to one chunk per file
+    pack : bool(optional)
+        Pack the variables into int16 where the encoding policy allows it, see tools.netcdf_encoding
 
+    Returns
+    -------
+    str
+        The path of the file
+    '''
+    if path is None:
+        path = os.path.join(merge_dir, 'Merged', 'WBTS_all_years_CTD_LADCP.nc')
+    try:
+        import dask
+    except ImportError:
+        print("Warning: dask is not installed, all years are merged in memory.")
+        ds_all = merge_years(merge_dir)
+        tools.write_netcdf(ds_all, path, pack=pack)
+    else:
+        ds_all = merge_years(merge_dir, lazy=True, chunks=chunks)
+        tools.write_netcdf(ds_all, path, pack=pack, compute=False).compute()
+    ds_all.close()
+    cast_index.write_cast_index(path)
+    return path
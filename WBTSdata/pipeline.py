@@ -0,0 +1,288 @@
+import os
+import time
+import traceback
+import concurrent.futures
+from WBTSdata import load_cal_files, load_vel_files, merge_datasets, tools, manifest, archive_index, instrumentation
+
+### sub-directories of output_dir and file name suffixes of the products
+products = {
+    'CTD': '_CTD.nc',
+    'ADCP': '_ADCP.nc',
+    'Merged': '_CTD_LADCP.nc',
+}
+### file name suffix of the products saved as contiguous ragged arrays, replacing '.nc'
+ragged_suffix = '_ragged.nc'
+
+
+def cruise_year(path):
+    '''
+    Get the 'YYYY_MM' string of a cruise from a path containing 'GC_YYYY_MM'.
+
+    Parameters
+    ----------
+    path : str
+        A path to a directory of the cruise
+
+    Returns
+    -------
+    str
+        The year and month of the cruise
+    '''
+    return path.split('GC_')[1][:7]
+
+def output_path(output_dir, year, product, ragged=False):
+    '''
+    Get the path of the file of a product for one cruise.
+
+    Parameters
+    ----------
+    output_dir : str
+        The directory the created files are stored in
+    year : str
+        The 'YYYY_MM' string of the cruise
+    product : str
+        One of 'CTD', 'ADCP' or 'Merged'
+    ragged : bool(optional)
+        Get the path of the file with contiguous ragged arrays, e.g. 'WBTS_2009_04_CTD_LADCP_ragged.nc'
+
+    Returns
+    -------
+    str
+        The path of the file
+    '''
+    suffix = products[product][:-len('.nc')] + ragged_suffix if ragged else products[product]
+    return os.path.join(output_dir, product, 'WBTS_' + year + suffix)
+
+def list_cruises(input_dir, index=None):
+    '''
+    Pair the CTD and ADCP directories of all cruises in the archive.
+
+    Parameters
+    ----------
+    input_dir : str
+        The path to the directory containing the WBTS data
+    index : dict(optional)
+        An index of the archive as returned by archive_index.get_index, used instead of walking input_dir
+
+    Returns
+    -------
+    list
+        A list of (year, cal_dir, vel_dir) tuples sorted by year. cal_dir or vel_dir is None
+        if the cruise has no CTD or ADCP data.
+    '''
+    if index is None:
+        index = archive_index.scan_archive(input_dir)
+    cruises = {}
+    for cal_dir in merge_datasets.dir_list_CTD(input_dir, index):
+        cruises[cruise_year(cal_dir)] = [cal_dir, None]
+    for vel_dir in merge_datasets.dir_list_ADCP(input_dir, index):
+        cruises.setdefault(cruise_year(vel_dir), [None, None])[1] = vel_dir
+    return [(year, cal_dir, vel_dir) for year, (cal_dir, vel_dir) in sorted(cruises.items())]
+
+def product_inputs(product, cal_dir, vel_dir):
+    '''
+    List the raw files a product of one cruise is created from.
+
+    Parameters
+    ----------
+    product : str
+        One of 'CTD', 'ADCP' or 'Merged'
+    cal_dir : str
+        The directory containing the .cal files, or None
+    vel_dir : str
+        The directory containing the .vel files, or None
+
+    Returns
+    -------
+    list
+        The paths to the raw files, None if the product cannot be created for the cruise
+    '''
+    if product == 'ADCP':
+        return manifest.list_inputs(vel_dir, '.vel') if vel_dir is not None else None
+    if cal_dir is None:
+        return None
+    if product == 'CTD':
+        return manifest.list_inputs(cal_dir, '.cal')
+    return manifest.list_inputs(cal_dir, '.cal') + manifest.list_inputs(vel_dir, '.vel')
+
+def write_dataset(ds, path, pack=False):
+    '''
+    Write a dataset to a NetCDF file with the encoding of tools.netcdf_encoding, replacing an existing file.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The dataset to write
+    path : str
+        The path of the file
+    pack : bool(optional)
+        Pack the variables into int16 where the encoding policy allows it
+    '''
+    tools.write_netcdf(ds, path, pack=pack)
+
+def build_cruise(year, cal_dir, vel_dir, output_dir, config, build=('CTD', 'ADCP', 'Merged'), ragged=False,
+                 depth_grid=None):
+    '''
+    Create and save the CTD, ADCP and merged files of one cruise.
+
+    Errors are caught and reported, so that one broken cruise does not stop the others.
+
+    Parameters
+    ----------
+    year : str
+        The 'YYYY_MM' string of the cruise
+    cal_dir : str
+        The directory containing the .cal files, or None
+    vel_dir : str
+        The directory containing the .vel files, or None
+    output_dir : str
+        The directory the created files are stored in
+    config : dict
+        The configuration dictionary
+    build : tuple(optional)
+        The products to create
+    ragged : bool(optional)
+        Save the casts as contiguous ragged arrays, see ragged.to_ragged
+    depth_grid : np.ndarray(optional)
+        Interpolate the casts of the merged file onto these DEPTH levels in m, see merge_datasets.merge_datasets
+
+    Returns
+    -------
+    dict
+        A report with the cruise, the created files, the error (None if successful), the run time and the
+        records of the stages as created by instrumentation.stage.
+    '''
+    start = time.perf_counter()
+    report = {'cruise': 'GC_' + year, 'files': [], 'error': None}
+    with instrumentation.collect('GC_' + year) as stages:
+        try:
+            _build_products(year, cal_dir, vel_dir, output_dir, config, build, ragged, depth_grid, report)
+        except Exception:
+            report['error'] = traceback.format_exc()
+    report['stages'] = stages
+    report['seconds'] = time.perf_counter() - start
+    return report
+
+def _build_products(year, cal_dir, vel_dir, output_dir, config, build, ragged, depth_grid, report):
+    if 'CTD' in build and cal_dir is not None:
+        path = output_path(output_dir, year, 'CTD', ragged)
+        write_dataset(load_cal_files.create_Dataset(cal_dir, config, ragged=ragged), path)
+        report['files'].append(path)
+    if 'ADCP' in build and vel_dir is not None:
+        path = output_path(output_dir, year, 'ADCP', ragged)
+        write_dataset(load_vel_files.create_Dataset(vel_dir, config, ragged=ragged), path)
+        report['files'].append(path)
+    if 'Merged' in build and cal_dir is not None:
+        path = output_path(output_dir, year, 'Merged', ragged)
+        write_dataset(merge_datasets.merge_datasets(cal_dir, vel_dir, config, ragged=ragged, depth_grid=depth_grid),
+                      path)
+        report['files'].append(path)
+
+def build_archive(input_dir=None, output_dir=None, workers=None, build=('CTD', 'ADCP', 'Merged'), config=None,
+                  incremental=False, index=None, report_path=None, only=None, ragged=False, depth_grid=None):
+    '''
+    Create the CTD, ADCP and merged files of all cruises in the archive, processing the cruises in parallel.
+
+    The raw files, the package version and the configuration section of every created file are recorded in
+    a build manifest in output_dir. With incremental=True only the files whose record changed are created again.
+
+    Parameters
+    ----------
+    input_dir : str(optional)
+        The path to the directory containing the WBTS data, defaults to input_dir of the configuration
+    output_dir : str(optional)
+        The directory the created files are stored in, defaults to output_dir of the configuration
+    workers : int(optional)
+        The number of worker processes, defaults to the number of CPUs. With workers=1 all cruises
+        are processed in the current process.
+    build : tuple(optional)
+        The products to create, any of 'CTD', 'ADCP' and 'Merged'
+    config : dict(optional)
+        The configuration dictionary
+    incremental : bool(optional)
+        Skip the files which are up to date according to the build manifest
+    index : dict(optional)
+        An index of the archive as returned by archive_index.get_index, used instead of walking input_dir
+    report_path : str(optional)
+        Write the reports, with the timing, bytes read, cast counts and memory of every stage, and the record of
+        the discover stage to this JSON file, see instrumentation.write_report
+    only : list(optional)
+        Only process these cruises, e.g. ['GC_2019_06']
+    ragged : bool(optional)
+        Save the casts as contiguous ragged arrays instead of padding them, see ragged.to_ragged. The ragged
+        files get their own names, see output_path, and do not replace the padded files.
+    depth_grid : np.ndarray(optional)
+        Interpolate the casts of the merged files onto these DEPTH levels in m instead of merging them on the union
+        of the CTD and ADCP levels, e.g. regrid.standard_grid(config). The grid is recorded in the build manifest,
+        so incremental builds create the merged files again when it changes.
+
+    Returns
+    -------
+    list
+        One report per cruise as returned by build_cruise, sorted by cruise. Cruises without any
+        file to create are reported with 'skipped' set to True.
+    '''
+    if not isinstance(config, dict):
+        config = tools.get_config()
+    input_dir = input_dir or config['input_dir']
+    output_dir = output_dir or config['output_dir']
+    config = dict(config, input_dir=input_dir, output_dir=output_dir)
+    for product in build:
+        os.makedirs(os.path.join(output_dir, product), exist_ok=True)
+
+    build_manifest = manifest.load_manifest(output_dir)
+    entries = {}
+    jobs = []
+    reports = []
+    with instrumentation.collect() as stages, instrumentation.stage('discover') as record:
+        cruises = list_cruises(input_dir, index)
+        if only is not None:
+            cruises = [c for c in cruises if 'GC_' + c[0] in only]
+        record['cruises'] = len(cruises)
+    for year, cal_dir, vel_dir in cruises:
+        todo = []
+        for product in build:
+            inputs = product_inputs(product, cal_dir, vel_dir)
+            if inputs is None:
+                continue
+            path = output_path(output_dir, year, product, ragged)
+            previous = build_manifest.get(os.path.relpath(path, output_dir))
+            section = config.get('GC_' + year, {})
+            ### the merged files on a depth grid are different outputs of the same inputs
+            if product == 'Merged' and depth_grid is not None:
+                section = dict(section, depth_grid=[float(z) for z in depth_grid])
+            entries[path] = manifest.create_entry(inputs, section, previous)
+            if not (incremental and manifest.is_up_to_date(entries[path], previous, path)):
+                todo.append(product)
+        if todo:
+            jobs.append((year, cal_dir, vel_dir, output_dir, config, tuple(todo), ragged, depth_grid))
+        else:
+            reports.append({'cruise': 'GC_' + year, 'files': [], 'error': None, 'seconds': 0.0, 'skipped': True,
+                            'stages': []})
+
+    def finish(report):
+        report['skipped'] = False
+        for path in report['files']:
+            build_manifest[os.path.relpath(path, output_dir)] = entries[path]
+        manifest.save_manifest(build_manifest, output_dir)
+        reports.append(report)
+        _print_report(report)
+
+    if workers == 1:
+        for job in jobs:
+            finish(build_cruise(*job))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(build_cruise, *job) for job in jobs]
+            for future in concurrent.futures.as_completed(futures):
+                finish(future.result())
+    reports = sorted(reports, key=lambda x: x['cruise'])
+    if report_path is not None:
+        instrumentation.write_report(reports, report_path, stages)
+    return reports
+
+def _print_report(report):
+    if report['error'] is None:
+        print(f"{report['cruise']}: saved {len(report['files'])} files in {report['seconds']:.1f} s")
+    else:
+        print(f"{report['cruise']}: failed\n{report['error']}")
@@ -1,5 +1,4 @@
 import numpy as np
-import matplotlib.pyplot as plt
 
 
 def plot_cast_over_time(ds_all):
@@ -19,6 +18,8 @@ def plot_cast_over_time(ds_all):
     fig, ax : matplotlib.figure.Figure, matplotlib.axes.Axes
         The figure and axes of the plot.
     '''
+    ### matplotlib is only imported when plotting, the workers of the pipeline do not need it
+    import matplotlib.pyplot as plt
     fig, ax = plt.subplots(figsize=(15, 8))
     ax.set_title('Cast over Time', fontsize=15)
 
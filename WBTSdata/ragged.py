@@ -0,0 +1,123 @@
+import numpy as np
+import xarray as xr
+
+### the dimension of the observations in the contiguous ragged array representation
+obs_dim = 'OBS'
+
+
+def to_ragged(ds, level='DEPTH', instance='DATETIME'):
+    '''
+    Convert a padded (instance x level) dataset into the CF contiguous ragged array representation of profiles.
+
+    Only the levels where at least one variable of a profile holds data are kept. The observations of each
+    profile are stored contiguously along OBS and the variable rowSize holds their number per profile.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The padded dataset, e.g. as created by load_cal_files.create_Dataset
+    level : str(optional)
+        The vertical coordinate, 'PRES' for CTD data and 'DEPTH' for ADCP and merged data
+    instance : str(optional)
+        The dimension of the profiles
+
+    Returns
+    -------
+    xarray.Dataset
+        The ragged dataset with the dimensions instance and OBS
+    '''
+    profile_vars = [var for var in ds.data_vars if level in ds[var].dims]
+    ### observations are kept where any of the variables is not NaN
+    mask = np.zeros((ds.sizes[instance], ds.sizes[level]), dtype=bool)
+    for var in profile_vars:
+        mask |= ds[var].notnull().transpose(instance, level).values
+    row, col = np.nonzero(mask)
+
+    ds_ragged = ds.drop_dims(level)
+    for var in profile_vars:
+        values = ds[var].transpose(instance, level).values
+        ds_ragged[var] = xr.Variable(obs_dim, values[row, col], ds[var].attrs)
+    ds_ragged.coords[level] = xr.Variable(obs_dim, ds[level].values[col], ds[level].attrs)
+    ds_ragged['rowSize'] = xr.Variable(instance, mask.sum(axis=1).astype('int32'),
+                                       {'long_name': 'number of observations for this profile',
+                                        'sample_dimension': obs_dim})
+    ds_ragged.attrs['featureType'] = 'profile'
+    return ds_ragged
+
+def row_offsets(ds):
+    '''
+    Get the position of the first observation of each profile in a ragged dataset.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The ragged dataset as returned by to_ragged
+
+    Returns
+    -------
+    np.ndarray
+        The offsets of the profiles along OBS, with the total number of observations appended
+    '''
+    return np.concatenate([[0], np.cumsum(ds['rowSize'].values)])
+
+def select_profiles(ds, index, instance='DATETIME'):
+    '''
+    Select profiles of a ragged dataset, without padding them.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The ragged dataset as returned by to_ragged
+    index : int, slice or array-like
+        The positions of the profiles along instance
+    instance : str(optional)
+        The dimension of the profiles
+
+    Returns
+    -------
+    xarray.Dataset
+        The ragged dataset of the selected profiles
+    '''
+    offsets = row_offsets(ds)
+    positions = np.arange(ds.sizes[instance])[index]
+    positions = np.atleast_1d(positions)
+    obs = np.concatenate([np.arange(offsets[i], offsets[i + 1]) for i in positions] + [np.zeros(0, dtype=int)])
+    return ds.isel({instance: positions, obs_dim: obs})
+
+def to_padded(ds, level=None, instance='DATETIME'):
+    '''
+    Convert a ragged dataset back into a padded (instance x level) dataset.
+
+    The vertical grid is the union of the levels of the profiles in ds, so padding a few profiles selected
+    with select_profiles only creates the arrays these profiles need.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The ragged dataset as returned by to_ragged
+    level : str(optional)
+        The vertical coordinate, defaults to the coordinate along OBS
+    instance : str(optional)
+        The dimension of the profiles
+
+    Returns
+    -------
+    xarray.Dataset
+        The padded dataset, levels not covered by a profile are filled with NaN
+    '''
+    if level is None:
+        level = [c for c in ds.coords if ds[c].dims == (obs_dim,)][0]
+    levels = ds[level].values
+    grid = np.unique(levels)
+    ### position of every observation in the (profile x level) arrays
+    row = np.repeat(np.arange(ds.sizes[instance]), ds['rowSize'].values)
+    col = np.searchsorted(grid, levels)
+
+    profile_vars = [var for var in ds.data_vars if ds[var].dims == (obs_dim,)]
+    ds_padded = ds.drop_dims(obs_dim).drop_vars('rowSize')
+    for var in profile_vars:
+        arr = np.full((ds.sizes[instance], len(grid)), np.nan)
+        arr[row, col] = ds[var].values
+        ds_padded[var] = xr.Variable((instance, level), arr, ds[var].attrs)
+    ds_padded.coords[level] = xr.Variable(level, grid, ds[level].attrs)
+    return ds_padded
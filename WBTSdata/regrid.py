@@ -0,0 +1,196 @@
+import copy
+import numpy as np
+import xarray as xr
+from WBTSdata import tools, vocabularies
+
+### variables of the ADCP in a merged dataset, the other profile variables are from the CTD
+adcp_variables = ['U_WATER_VELOCITY', 'V_WATER_VELOCITY', 'ERROR_VELOCITY']
+
+def standard_grid(config=None):
+    '''
+    Get the standard DEPTH grid of the configuration.
+
+    Parameters
+    ----------
+    config : dict(optional)
+        The configuration dictionary with the section depth_grid containing start, stop and step in m
+
+    Returns
+    -------
+    np.ndarray
+        The depth levels from start to stop, including stop
+    '''
+    if not isinstance(config, dict):
+        config = tools.get_config()
+    grid = config['depth_grid']
+    return np.arange(grid['start'], grid['stop'] + grid['step'] / 2, grid['step'], dtype=float)
+
+def depth_from_pressure(pres, lat):
+    '''
+    Compute the depth from the pressure with gsw.z_from_p.
+
+    Parameters
+    ----------
+    pres : np.ndarray
+        The pressure in dbar, with casts along the first axis
+    lat : np.ndarray
+        The latitude of each cast
+
+    Returns
+    -------
+    np.ndarray
+        The depth in m, positive down, with the shape of pres
+    '''
+    import gsw
+    lat = np.asarray(lat, dtype=float).reshape((-1,) + (1,) * (np.ndim(pres) - 1))
+    return -gsw.z_from_p(pres, lat)
+
+def interpolate_profiles(z, values, grid, max_gap=None):
+    '''
+    Interpolate the profiles of all casts linearly onto a common grid at once.
+
+    The valid observations of all casts are sorted by the key cast * span + z, so a single np.searchsorted
+    finds the neighbours of every grid level in every cast. Levels outside the range of a cast are NaN.
+
+    Parameters
+    ----------
+    z : np.ndarray
+        The vertical coordinate of the observations, shape (casts, levels), NaN where there is no observation
+    values : np.ndarray
+        The values of the observations, shape (casts, levels)
+    grid : np.ndarray
+        The increasing levels to interpolate to
+    max_gap : float(optional)
+        Levels between two observations further apart than max_gap are set to NaN
+
+    Returns
+    -------
+    np.ndarray
+        The interpolated values, shape (casts, len(grid))
+    '''
+    z, values = np.broadcast_arrays(np.asarray(z, dtype=float), np.asarray(values, dtype=float))
+    grid = np.asarray(grid, dtype=float)
+    n = values.shape[0]
+    rows, cols = np.nonzero(~np.isnan(z) & ~np.isnan(values))
+    if len(rows) == 0:
+        return np.full((n, len(grid)), np.nan)
+    zmin = min(z[rows, cols].min(), grid.min())
+    span = max(z[rows, cols].max(), grid.max()) - zmin + 1
+    key = rows * span + (z[rows, cols] - zmin)
+    order = np.argsort(key, kind='stable')
+    key, rows, v = key[order], rows[order], values[rows, cols][order]
+
+    target_rows = np.repeat(np.arange(n), len(grid))
+    target = target_rows * span + np.tile(grid - zmin, n)
+    j = np.searchsorted(key, target)
+    lo = np.clip(j - 1, 0, len(key) - 1)
+    hi = np.clip(j, 0, len(key) - 1)
+    ### both neighbours have to belong to the cast of the grid level
+    inside = (j > 0) & (j < len(key)) & (rows[lo] == target_rows) & (rows[hi] == target_rows)
+    if max_gap is not None:
+        inside &= key[hi] - key[lo] <= max_gap
+    exact = (j < len(key)) & (key[hi] == target)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = (target - key[lo]) / (key[hi] - key[lo])
+        result = np.where(inside, v[lo] + weight * (v[hi] - v[lo]), np.nan)
+    result[exact] = v[hi][exact]
+    return result.reshape(n, len(grid))
+
+def regrid(ds, grid, level='DEPTH', max_gap=None):
+    '''
+    Interpolate all casts of a dataset onto a standard DEPTH grid.
+
+    For CTD data on PRES, the depth of every observation is computed from the pressure and the latitude of the
+    cast with gsw, and the pressure is kept as the variable PRES on the new grid.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The padded dataset with the dimensions DATETIME and level
+    grid : np.ndarray
+        The DEPTH levels in m, e.g. as returned by standard_grid
+    level : str(optional)
+        The vertical coordinate of ds, 'PRES' or 'DEPTH'
+    max_gap : float(optional)
+        Levels between two observations further apart than max_gap are set to NaN
+
+    Returns
+    -------
+    xarray.Dataset
+        The dataset with the dimensions DATETIME and DEPTH
+    '''
+    profile_vars = [var for var in ds.data_vars if level in ds[var].dims]
+    ds_grid = ds.drop_dims(level)
+    if level == 'PRES':
+        pres = np.broadcast_to(ds['PRES'].values, (ds.sizes['DATETIME'], ds.sizes['PRES']))
+        z = depth_from_pressure(pres, ds['LATITUDE'].values)
+        ds_grid['PRES'] = xr.Variable(('DATETIME', 'DEPTH'), interpolate_profiles(z, pres, grid, max_gap),
+                                      ds['PRES'].attrs)
+    else:
+        z = ds[level].values[np.newaxis, :]
+    for var in profile_vars:
+        values = ds[var].transpose('DATETIME', level).values
+        ds_grid[var] = xr.Variable(('DATETIME', 'DEPTH'), interpolate_profiles(z, values, grid, max_gap),
+                                   ds[var].attrs)
+    attrs = ds[level].attrs if level == 'DEPTH' else copy.deepcopy(vocabularies.vocab_attrs['DEPTH'])
+    ds_grid.coords['DEPTH'] = xr.Variable('DEPTH', np.asarray(grid, dtype=float), attrs)
+    return ds_grid
+
+def merged_depth(ds):
+    '''
+    Get the depth of the levels of a merged dataset on the union of the CTD and ADCP levels.
+
+    merge_datasets.merge_datasets without depth_grid renames the PRES levels of the CTD to DEPTH, so the
+    DEPTH of the CTD variables is a pressure in dbar, while the DEPTH of the ADCP variables, see adcp_variables,
+    is in m.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The merged dataset with the dimensions DATETIME and DEPTH
+
+    Returns
+    -------
+    z_ctd : np.ndarray
+        The depth in m of the levels of the CTD variables, computed from the pressure, shape (casts, levels)
+    z_adcp : np.ndarray
+        The depth in m of the levels of the ADCP variables, shape (casts, levels)
+    '''
+    z_adcp = np.broadcast_to(ds['DEPTH'].values.astype(float), (ds.sizes['DATETIME'], ds.sizes['DEPTH']))
+    return depth_from_pressure(z_adcp, ds['LATITUDE'].values), z_adcp
+
+def regrid_merged(ds, grid, max_gap=None):
+    '''
+    Interpolate a merged dataset on the union of the CTD and ADCP levels onto a standard DEPTH grid.
+
+    The CTD variables are interpolated from the depth computed from their pressure, see merged_depth, and the
+    pressure is kept as the variable PRES, as in regrid with level='PRES'.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The merged dataset as created by merge_datasets.merge_datasets without depth_grid
+    grid : np.ndarray
+        The DEPTH levels in m, e.g. as returned by standard_grid
+    max_gap : float(optional)
+        Levels between two observations further apart than max_gap are set to NaN
+
+    Returns
+    -------
+    xarray.Dataset
+        The dataset with the dimensions DATETIME and DEPTH in m
+    '''
+    z_ctd, z_adcp = merged_depth(ds)
+    profile_vars = [var for var in ds.data_vars if 'DEPTH' in ds[var].dims]
+    ds_grid = ds.drop_dims('DEPTH')
+    ### the levels of the CTD are pressures, z_adcp holds them unchanged
+    ds_grid['PRES'] = xr.Variable(('DATETIME', 'DEPTH'), interpolate_profiles(z_ctd, z_adcp, grid, max_gap),
+                                  copy.deepcopy(vocabularies.vocab_attrs['PRES']))
+    for var in profile_vars:
+        z = z_adcp if var in adcp_variables else z_ctd
+        values = ds[var].transpose('DATETIME', 'DEPTH').values
+        ds_grid[var] = xr.Variable(('DATETIME', 'DEPTH'), interpolate_profiles(z, values, grid, max_gap),
+                                   ds[var].attrs)
+    ds_grid.coords['DEPTH'] = xr.Variable('DEPTH', np.asarray(grid, dtype=float),
+                                          copy.deepcopy(vocabularies.vocab_attrs['DEPTH']))
+    return ds_grid
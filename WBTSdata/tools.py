@@ -1,28 +1,149 @@
+import numpy as np
 import xarray as xr
-from . import vocabularies
+from . import vocabularies, instrumentation
 import yaml
 import pathlib
 import os
+import copy
+import itertools
+import collections
+import concurrent.futures
 
-def get_config():
+### environment variable overriding the path of the configuration file
+config_env_var = 'WBTSDATA_CONFIG'
+### parsed configuration files, keyed by path, with the modification time they were parsed at
+_config_cache = {}
+
+def get_config_path():
     """
-    Get the configuration settings from a YAML file.
+    Get the path of the configuration file.
 
     Returns
     -------
-    dict: The configuration settings.
+    str: The path given by the environment variable WBTSDATA_CONFIG, or 'config.yaml' of the package.
     """
+    if os.environ.get(config_env_var):
+        return os.environ[config_env_var]
     # Set the directory for yaml files as the root directory + 'load_data/' --> Could be in 'config/' instead
     script_dir = pathlib.Path(__file__).parent.absolute()
     parent_dir = script_dir.parents[0]
     rootdir = parent_dir
     config_dir = os.path.join(rootdir, 'WBTSdata')
+    return os.path.join(config_dir, 'config.yaml')
+
+def get_config(configpath=None):
+    """
+    Get the configuration settings from a YAML file.
 
+    The parsed file is cached and only read again when its modification time changes.
+
+    Parameters
+    ----------
+    configpath (str, optional): The path of the configuration file, defaults to get_config_path().
+
+    Returns
+    -------
+    dict: The configuration settings.
+    """
     ### import basepath from mission_config.yaml
-    configpath = os.path.join(config_dir, 'config.yaml')
-    with open(configpath, 'r') as file:
-        config = yaml.safe_load(file)
-    return config
+    configpath = os.path.abspath(configpath or get_config_path())
+    mtime = os.stat(configpath).st_mtime_ns
+    cached = _config_cache.get(configpath)
+    if cached is None or cached[0] != mtime:
+        with open(configpath, 'r') as file:
+            cached = (mtime, yaml.safe_load(file))
+        _config_cache[configpath] = cached
+    ### return a copy, so that changes of the caller do not end up in the cache
+    return copy.deepcopy(cached[1])
+
+def clear_config_cache():
+    """
+    Clear the cache of get_config, so that the configuration files are read again on the next call.
+    """
+    _config_cache.clear()
+
+def datetime_string(value):
+    """
+    Format a datetime as 'YYYY-mm-dd HH:MM:SS'.
+
+    Parameters
+    ----------
+    value (np.datetime64 or datetime.datetime): The datetime.
+
+    Returns
+    -------
+    str: The formatted datetime.
+    """
+    return str(np.datetime64(value, 's')).replace('T', ' ')
+
+def read_files(paths, threads=1):
+    """
+    Read the content of files, with up to threads files read concurrently by a thread pool.
+
+    The contents are yielded in the order of paths, so that they can be parsed in order while the next files are
+    read. At most 2 * threads files are read ahead of the caller. This hides the latency of network file systems.
+
+    Parameters
+    ----------
+    paths (list): The paths to the files.
+    threads (int, optional): The maximum number of files read at once, 1 to read the files one after the other.
+
+    Yields
+    ------
+    bytes: The content of each file.
+    """
+    def read(path):
+        with open(path, 'rb') as file:
+            return file.read()
+
+    if threads <= 1:
+        for path in paths:
+            yield read(path)
+        return
+    paths = iter(paths)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+        pending = collections.deque(pool.submit(read, path) for path in itertools.islice(paths, 2 * threads))
+        while pending:
+            content = pending.popleft().result()
+            for path in itertools.islice(paths, 1):
+                pending.append(pool.submit(read, path))
+            yield content
+
+def stack_casts(times, data, column_names, level):
+    """
+    Build a (DATETIME x level) Dataset from the data blocks of all casts of a cruise.
+
+    The vertical grid is the union of the levels of all casts. It is computed once and every cast is
+    written into preallocated arrays, levels which a cast does not cover are filled with NaN.
+
+    Parameters
+    ----------
+    times (array-like): The datetime of each cast.
+    data (list): A list of 2-D np.ndarrays, one per cast, with one column per entry in column_names.
+    column_names (list): The names of the columns of the data blocks.
+    level (str): The column holding the vertical coordinate, e.g. 'pr' or 'z_depth'.
+
+    Returns
+    -------
+    xarray.Dataset: The dataset with the dimensions DATETIME and level.
+    """
+    k = column_names.index(level)
+    levels = [d[:, k] for d in data]
+    grid = np.unique(np.concatenate(levels))
+    ### position of every observation in the (cast x level) arrays
+    row = np.repeat(np.arange(len(data)), [len(l) for l in levels])
+    col = np.searchsorted(grid, np.concatenate(levels))
+    values = np.concatenate(data)
+
+    data_vars = {}
+    for j, name in enumerate(column_names):
+        if j == k:
+            continue
+        arr = np.full((len(data), len(grid)), np.nan)
+        arr[row, col] = values[:, j]
+        data_vars[name] = (('DATETIME', level), arr)
+    coords = {'DATETIME': np.asarray(times, dtype='datetime64[ns]'), level: grid}
+    return xr.Dataset(data_vars, coords=coords)
 
 def convert_units(ds, preferred_units=vocabularies.preferred_units, unit_conversion=vocabularies.unit_conversion):
     """
@@ -53,3 +174,147 @@ def convert_units(ds, preferred_units=vocabularies.preferred_units, unit_convers
                 ds[var].attrs['units'] = new_unit
 
     return ds
+
+def packing(da, resolution, vocab_attrs=vocabularies.vocab_attrs):
+    """
+    Get the int16 packing of a variable with scale_factor and add_offset derived from its valid range.
+
+    Parameters
+    ----------
+    da (xarray.DataArray): The variable, its name is looked up in vocab_attrs.
+    resolution (float): The resolution the values are stored with.
+    vocab_attrs (dict): The vocabulary attributes containing valid_min and valid_max of the variable.
+
+    Returns
+    -------
+    dict: The encoding with dtype, scale_factor, add_offset and _FillValue, or None if the variable has no
+    valid range, the range does not fit into int16 with the resolution or the values lie outside the range.
+    """
+    attrs = vocab_attrs.get(da.name, {})
+    if 'valid_min' not in attrs or 'valid_max' not in attrs:
+        return None
+    valid_min, valid_max = attrs['valid_min'], attrs['valid_max']
+    ### -32767 is kept free for the fill value
+    if (valid_max - valid_min) / resolution > 2 * 32766:
+        return None
+    vmin, vmax = da.min().values, da.max().values
+    if not np.isnan(vmin) and (vmin < valid_min or vmax > valid_max):
+        return None
+    return {'dtype': 'int16', 'scale_factor': resolution, 'add_offset': (valid_max + valid_min) / 2,
+            '_FillValue': np.int16(-32767)}
+
+def integer_encoding(da, dtype):
+    """
+    Get the encoding of a variable as integers, e.g. a float flag or cast number holding only whole numbers.
+
+    Parameters
+    ----------
+    da (xarray.DataArray): The variable.
+    dtype (str): The integer dtype, e.g. 'int8'.
+
+    Returns
+    -------
+    dict: The encoding with dtype, and for float variables the smallest value of dtype as _FillValue of the NaNs,
+    or None if the values are not whole numbers or do not fit into dtype.
+    """
+    if da.dtype.kind in 'iu':
+        return {'dtype': dtype}
+    info = np.iinfo(dtype)
+    values = np.asarray(da.values)
+    values = values[~np.isnan(values)]
+    ### the smallest value is kept free for the fill value
+    if np.any(values != np.round(values)) or np.any(values <= info.min) or np.any(values > info.max):
+        return None
+    return {'dtype': dtype, '_FillValue': info.min}
+
+def netcdf_encoding(ds, pack=False, policy=vocabularies.encoding_policy, defaults=vocabularies.encoding_defaults):
+    """
+    Create the encoding of the data variables of a dataset for writing it to a NetCDF file.
+
+    Float variables are stored as float32 with NaN as fill value, compressed with zlib and chunked along the
+    dimensions given in the defaults. Variables with an integer dtype in the policy are stored with this dtype
+    if their values are whole numbers, see integer_encoding.
+
+    Parameters
+    ----------
+    ds (xarray.Dataset): The dataset to write.
+    pack (bool, optional): Pack the variables with a resolution in the policy into int16, where their values fit
+    the valid range of vocab_attrs. This discards precision below the resolution.
+    policy (dict): The per-variable encoding, with 'dtype' and/or 'resolution'.
+    defaults (dict): The default dtype, compression and chunk sizes.
+
+    Returns
+    -------
+    dict: The encoding for xarray.Dataset.to_netcdf.
+    """
+    encoding = {}
+    for var in ds.data_vars:
+        da = ds[var]
+        if da.dtype.kind not in 'iuf':
+            continue
+        var_policy = policy.get(var, {})
+        enc = {'zlib': defaults['zlib'], 'complevel': defaults['complevel'], 'shuffle': defaults['shuffle']}
+        packed = packing(da, var_policy['resolution']) if pack and 'resolution' in var_policy else None
+        if packed is None and 'dtype' in var_policy:
+            packed = integer_encoding(da, var_policy['dtype'])
+        if packed is not None:
+            enc.update(packed)
+        elif da.dtype.kind == 'f':
+            enc.update({'dtype': defaults['dtype'], '_FillValue': np.float32(np.nan)})
+        if da.ndim > 0 and all(da.sizes[dim] > 0 for dim in da.dims):
+            enc['chunksizes'] = tuple(min(da.sizes[dim], defaults['chunks'].get(dim, da.sizes[dim]))
+                                      for dim in da.dims)
+        encoding[var] = enc
+    return encoding
+
+def zarr_encoding(ds, pack=False, policy=vocabularies.encoding_policy, defaults=vocabularies.encoding_defaults):
+    """
+    Create the encoding of the data variables of a dataset for writing it to a Zarr store.
+
+    The dtypes, fill values, packing and chunk shapes are the same as in netcdf_encoding, the compression is
+    left to the default compressor of zarr. DATETIME is stored as integer seconds since 1970, so that casts
+    appended later are encoded with the same units.
+
+    Parameters
+    ----------
+    ds (xarray.Dataset): The dataset to write.
+    pack (bool, optional): Pack variables into int16, see netcdf_encoding.
+    policy (dict): The per-variable encoding, with 'dtype' and/or 'resolution'.
+    defaults (dict): The default dtype and chunk sizes.
+
+    Returns
+    -------
+    dict: The encoding for xarray.Dataset.to_zarr.
+    """
+    encoding = {}
+    for var, enc in netcdf_encoding(ds, pack=pack, policy=policy, defaults=defaults).items():
+        enc = {key: value for key, value in enc.items() if key not in ('zlib', 'complevel', 'shuffle')}
+        if 'chunksizes' in enc:
+            enc['chunks'] = enc.pop('chunksizes')
+        encoding[var] = enc
+    if 'DATETIME' in ds.variables:
+        encoding['DATETIME'] = {'units': 'seconds since 1970-01-01', 'dtype': 'int64'}
+    return encoding
+
+def write_netcdf(ds, path, pack=False, compute=True):
+    """
+    Write a dataset to a NetCDF file with the encoding of netcdf_encoding, replacing an existing file.
+
+    Parameters
+    ----------
+    ds (xarray.Dataset): The dataset to write.
+    path (str): The path of the file.
+    pack (bool, optional): Pack variables into int16, see netcdf_encoding.
+    compute (bool, optional): Write dask arrays immediately. If False, a dask.delayed object is returned.
+
+    Returns
+    -------
+    None or dask.delayed.Delayed: As returned by xarray.Dataset.to_netcdf.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    with instrumentation.stage('write', path=path, casts=ds.sizes.get('DATETIME')) as record:
+        delayed = ds.to_netcdf(path, encoding=netcdf_encoding(ds, pack=pack), compute=compute)
+        if compute:
+            record['bytes_written'] = os.path.getsize(path)
+    return delayed
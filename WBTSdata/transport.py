@@ -0,0 +1,178 @@
+import concurrent.futures
+import numpy as np
+import pandas as pd
+import xarray as xr
+from WBTSdata import vocabularies, cast_index, ragged
+
+### metres per degree of latitude, and of longitude at the equator
+m_per_deg_lat = 110574.0
+m_per_deg_lon = 111320.0
+### columns of the tables returned by transport
+columns = ['cruise', 'section', 'start', 'end', 'n_casts', 'width', 'transport']
+
+
+def section_frame(lat, lon, positive=0):
+    '''
+    Compute the along-section distance of the casts and the unit normal of the section.
+
+    The direction of the section is the principal axis of the cast positions in a local metric frame.
+    The normal points to the side of the compass direction positive.
+
+    Parameters
+    ----------
+    lat : np.ndarray
+        The latitudes of the casts
+    lon : np.ndarray
+        The longitudes of the casts
+    positive : float(optional)
+        The compass direction of positive transport in degrees, e.g. 0 for northward
+
+    Returns
+    -------
+    distance : np.ndarray
+        The distance of each cast along the section in m
+    normal : np.ndarray
+        The eastward and northward component of the unit normal
+    '''
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    lat0 = lat.mean()
+    x = (lon - lon.mean()) * m_per_deg_lon * np.cos(np.deg2rad(lat0))
+    y = (lat - lat0) * m_per_deg_lat
+    xy = np.stack([x, y], axis=1)
+    direction = np.linalg.svd(xy, full_matrices=False)[2][0] if len(xy) > 1 else np.array([1.0, 0.0])
+    normal = np.array([-direction[1], direction[0]])
+    reference = np.array([np.sin(np.deg2rad(positive)), np.cos(np.deg2rad(positive))])
+    if normal @ reference < 0:
+        normal = -normal
+    distance = xy @ direction
+    return distance - distance.min(), normal
+
+def depth_integral(values, depth):
+    '''
+    Integrate profiles in depth with the trapezoid rule between the levels with data, without extrapolating.
+
+    The levels without data are skipped, e.g. the levels of the CTD between the bins of the LADCP in a merged dataset.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        The profiles, shape (casts, levels)
+    depth : np.ndarray
+        The levels in m
+
+    Returns
+    -------
+    np.ndarray
+        The integral of each cast, NaN for casts with data on fewer than two levels
+    '''
+    ### the levels with data of all casts in one sequence, consecutive levels of the same cast bound a layer
+    rows, columns = np.nonzero(~np.isnan(values))
+    data, z = values[rows, columns], np.asarray(depth, dtype=float)[columns]
+    same_cast = rows[1:] == rows[:-1]
+    layers = 0.5 * (data[1:] + data[:-1]) * np.diff(z)
+    integral = np.bincount(rows[1:][same_cast], weights=layers[same_cast], minlength=values.shape[0])
+    n_layers = np.bincount(rows[1:][same_cast], minlength=values.shape[0])
+    return np.where(n_layers > 0, integral, np.nan)
+
+def section_transport(ds, positive=0):
+    '''
+    Compute the volume transport across a section occupied by the casts of a dataset.
+
+    The velocities are rotated to the section normal, integrated in depth for every cast and then integrated
+    along the section with the trapezoid rule, all as array operations over (cast x depth).
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The padded casts of one section, with U_WATER_VELOCITY and V_WATER_VELOCITY in m s-1 on DEPTH in m
+    positive : float(optional)
+        The compass direction of positive transport in degrees
+
+    Returns
+    -------
+    dict
+        The transport in Sv, the width of the section in km and the number of casts with velocity data
+    '''
+    distance, normal = section_frame(ds['LATITUDE'].values, ds['LONGITUDE'].values, positive)
+    normal_velocity = (normal[0] * ds['U_WATER_VELOCITY'].transpose('DATETIME', 'DEPTH').values
+                       + normal[1] * ds['V_WATER_VELOCITY'].transpose('DATETIME', 'DEPTH').values)
+    per_cast = depth_integral(normal_velocity, ds['DEPTH'].values)
+    valid = ~np.isnan(per_cast)
+    order = np.argsort(distance[valid])
+    x, q = distance[valid][order], per_cast[valid][order]
+    total = np.sum(0.5 * (q[1:] + q[:-1]) * np.diff(x)) if len(q) > 1 else np.nan
+    return {'transport': total / 1e6, 'width': (x[-1] - x[0]) / 1e3 if len(x) else np.nan, 'n_casts': int(valid.sum())}
+
+def transport(ds, boxes=vocabularies.section_boxes):
+    '''
+    Compute the volume transport across every section of every cruise in a dataset.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The merged dataset of one cruise or of all years, padded or ragged
+    boxes : dict(optional)
+        The ranges and directions of positive transport of the sections, see vocabularies.section_boxes
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per cruise and section with the cruise, the section, the time of the first and last cast,
+        the number of casts with velocity data, the width of the section in km and the transport in Sv
+    '''
+    if 'rowSize' in ds:
+        ds = ragged.to_padded(ds)
+    sections = cast_index.section_of(ds['LATITUDE'].values, ds['LONGITUDE'].values, boxes)
+    cruises = ds['GC_STRING'].values.astype(str)
+    rows = []
+    for cruise in np.unique(cruises):
+        for section in boxes:
+            positions = np.nonzero((cruises == cruise) & (sections == section))[0]
+            if len(positions) == 0:
+                continue
+            ds_section = ds.isel(DATETIME=positions)
+            result = section_transport(ds_section, boxes[section]['positive'])
+            rows.append({'cruise': cruise, 'section': section,
+                         'start': ds_section['DATETIME'].values.min(), 'end': ds_section['DATETIME'].values.max(),
+                         **result})
+    return pd.DataFrame(rows, columns=columns)
+
+def file_transport(path):
+    '''
+    Compute the volume transport across the sections of a merged file, see transport.
+
+    Parameters
+    ----------
+    path : str
+        The path to the merged file of one cruise
+
+    Returns
+    -------
+    pandas.DataFrame
+        The transports as returned by transport
+    '''
+    with xr.open_dataset(path) as ds:
+        return transport(ds.load())
+
+def transport_files(paths, workers=1):
+    '''
+    Compute the volume transport across the sections of several merged files, processing the files in parallel.
+
+    Parameters
+    ----------
+    paths : list
+        The paths to the merged files, e.g. merge_datasets.merged_files(merge_dir)
+    workers : int(optional)
+        The number of worker processes. With workers=1 the files are processed in the current process.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The transports as returned by transport, for all files, without rows if paths is empty
+    '''
+    if workers == 1:
+        tables = [file_transport(path) for path in paths]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            tables = list(pool.map(file_transport, paths))
+    return pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=columns)
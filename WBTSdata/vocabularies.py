@@ -46,6 +46,14 @@ standard_names = {
 
 vars_to_remove = []
 
+# Longitude and latitude ranges of the sections, used to assign the casts to a section in the cast index.
+# 'positive' is the compass direction in degrees of positive transport across the section.
+section_boxes = {
+    'Florida Straits': {'lon': (-80.2, -78.9), 'lat': (26.3, 27.5), 'positive': 0},
+    'Northwest Providence Channel': {'lon': (-78.9, -77.3), 'lat': (25.5, 26.8), 'positive': 270},
+    'Abaco': {'lon': (-77.3, -69.0), 'lat': (25.5, 27.5), 'positive': 0},
+}
+
 vocab_attrs = {
     "LATITUDE": {
         "coordinate_reference_frame": "urn:ogc:crs:EPSG::4326",
@@ -182,6 +190,26 @@ vocab_attrs = {
         "valid_min": 0,
         "URI": "",
     },
+    "GEOSTROPHIC_VELOCITY": {
+        "long_name": "Geostrophic water velocity between two casts relative to the reference pressure",
+        "observation_type": "calculated",
+        "comment": "Positive to the left of the direction from the first to the second cast of the pair",
+        "sources": "TEMP, PSAL, PRES",
+        "units": "m s-1",
+        "valid_max": 3,
+        "valid_min": -3,
+        "URI": "",
+    },
+    "ABSOLUTE_GEOSTROPHIC_VELOCITY": {
+        "long_name": "Geostrophic water velocity between two casts referenced to the LADCP velocity",
+        "observation_type": "calculated",
+        "comment": "Positive to the left of the direction from the first to the second cast of the pair",
+        "sources": "GEOSTROPHIC_VELOCITY, U_WATER_VELOCITY, V_WATER_VELOCITY",
+        "units": "m s-1",
+        "valid_max": 3,
+        "valid_min": -3,
+        "URI": "",
+    },
     "DYN_HEIGHT": {
         "long_name": "Dynamic height",
         "observation_type": "calculated",
@@ -211,3 +239,28 @@ vocab_attrs = {
     },
 
 }
+
+# Encoding of the variables in the NetCDF files. Data variables are stored as float32 by default.
+# Variables with a 'resolution' can be packed into int16 with scale_factor and add_offset derived from their
+# valid_min and valid_max in vocab_attrs, if the values of a dataset lie within that range.
+encoding_defaults = {
+    'dtype': 'float32',
+    'zlib': True,
+    'complevel': 4,
+    'shuffle': True,
+    'chunks': {'DATETIME': 64, 'DEPTH': 1024, 'PRES': 1024, 'OBS': 65536},
+}
+
+encoding_policy = {
+    "TEMP": {"resolution": 0.001},
+    "THETA": {"resolution": 0.001},
+    "PSAL": {"resolution": 0.001},
+    "DOXY": {"resolution": 0.01},
+    "U_WATER_VELOCITY": {"resolution": 0.0001},
+    "V_WATER_VELOCITY": {"resolution": 0.0001},
+    "ERROR_VELOCITY": {"resolution": 0.0001},
+    "GEOSTROPHIC_VELOCITY": {"resolution": 0.0001},
+    "ABSOLUTE_GEOSTROPHIC_VELOCITY": {"resolution": 0.0001},
+    "TIME_FLAG": {"dtype": "int8"},
+    "CAST_NUMBER": {"dtype": "int16"},
+}
@@ -0,0 +1,215 @@
+import os
+import numpy as np
+import xarray as xr
+from WBTSdata import merge_datasets, tools, cast_index, regrid, ragged
+
+
+def on_depth_grid(ds, grid):
+    '''
+    Put a merged dataset on the DEPTH grid in m of the store, so that all cruises can be appended along DATETIME.
+
+    A dataset merged on the union of the CTD and ADCP levels holds the CTD pressure in dbar on DEPTH. Its CTD
+    variables are interpolated from the depth computed from the pressure, see regrid.regrid_merged. A dataset
+    merged with a depth_grid, which keeps PRES as a variable, is interpolated with regrid.regrid unless it is
+    already on the grid. A dataset with observations outside the grid raises a ValueError instead of losing them.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The merged dataset of one cruise
+    grid : np.ndarray
+        The DEPTH grid of the store in m
+
+    Returns
+    -------
+    xarray.Dataset
+        The dataset on the grid, sorted by DATETIME
+    '''
+    on_pressure = 'PRES' not in ds.data_vars
+    if on_pressure:
+        z_ctd, z_adcp = regrid.merged_depth(ds)
+    else:
+        z_ctd = z_adcp = np.broadcast_to(ds.DEPTH.values.astype(float), (ds.sizes['DATETIME'], ds.sizes['DEPTH']))
+    depth = [np.where(ds[var].transpose('DATETIME', 'DEPTH').notnull().values,
+                      z_adcp if var in regrid.adcp_variables else z_ctd, np.nan)
+             for var in ds.data_vars if 'DEPTH' in ds[var].dims]
+    zmin, zmax = np.nanmin(depth), np.nanmax(depth)
+    if zmin < grid[0] or zmax > grid[-1]:
+        raise ValueError(f"The observations from {zmin:.1f} to {zmax:.1f} m are outside the DEPTH grid of the store "
+                         f"from {grid[0]} to {grid[-1]} m")
+    if on_pressure:
+        ds = regrid.regrid_merged(ds, grid)
+    elif not np.array_equal(ds.DEPTH.values, grid):
+        ds = regrid.regrid(ds, grid, 'DEPTH')
+    return ds.sortby('DATETIME')
+
+def summary_from_attrs(attrs):
+    '''
+    Get the extent of the data in a store from its global attributes, in the form of merge_datasets.summarise_dataset
+
+    Parameters
+    ----------
+    attrs : dict
+        The global attributes of the store
+
+    Returns
+    -------
+    dict
+        The minimum and maximum of DEPTH, LATITUDE, LONGITUDE and DATETIME
+    '''
+    return {'DEPTH': (attrs['geospatial_vertical_min'], attrs['geospatial_vertical_max']),
+            'LATITUDE': (attrs['geospatial_lat_min'], attrs['geospatial_lat_max']),
+            'LONGITUDE': (attrs['geospatial_lon_min'], attrs['geospatial_lon_max']),
+            'DATETIME': (np.datetime64(attrs['time_cruise_start']), np.datetime64(attrs['time_cruise_end']))}
+
+def update_attrs(store, attrs):
+    '''
+    Update the global attributes of a store without rewriting its arrays and consolidate its metadata (requires zarr)
+
+    Parameters
+    ----------
+    store : str
+        The path to the Zarr store
+    attrs : dict
+        The attributes to update
+    '''
+    import zarr
+    ### numpy scalars cannot be written to the JSON metadata
+    attrs = {key: value.item() if isinstance(value, np.generic) else value for key, value in attrs.items()}
+    zarr.open_group(store, mode='r+').attrs.update(attrs)
+    zarr.consolidate_metadata(store)
+
+def stored_cruises(store):
+    '''
+    List the cruises in a store.
+
+    Parameters
+    ----------
+    store : str
+        The path to the Zarr store
+
+    Returns
+    -------
+    list
+        The sorted GC strings of the cruises, empty if the store does not exist
+    '''
+    if not os.path.exists(store):
+        return []
+    with xr.open_zarr(store) as ds:
+        return sorted(set(ds.GC_STRING.values.tolist()))
+
+def append_cruise(ds, store, grid=None, pack=False):
+    '''
+    Append the merged dataset of one cruise to a Zarr store along DATETIME, creating the store if needed (requires zarr).
+
+    Only the new cruise is written, the chunks of the cruises in the store are not read or rewritten.
+    The geospatial and time attributes of the store are updated from the new cruise.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The merged dataset of one cruise, as created by merge_datasets.merge_datasets. A ragged dataset is padded
+        first, see ragged.to_padded
+    store : str
+        The path to the Zarr store
+    grid : np.ndarray(optional)
+        The DEPTH grid of the store in m, only used when the store is created. Defaults to the depth_grid of the
+        configuration, see regrid.standard_grid
+    pack : bool(optional)
+        Pack the variables into int16 where the encoding policy allows it, only used when the store is created
+
+    Returns
+    -------
+    bool
+        True if the cruise was appended, False if it is already in the store
+    '''
+    gc_string = str(ds.GC_STRING.values[0])
+    if gc_string in stored_cruises(store):
+        print(f"Warning: {gc_string} is already in {store} and is not appended again.")
+        return False
+    if 'rowSize' in ds:
+        ds = ragged.to_padded(ds)
+    summary = merge_datasets.summarise_dataset(ds)
+
+    if not os.path.exists(store):
+        ds = on_depth_grid(ds, regrid.standard_grid() if grid is None else grid)
+        ### the Zarr format 2 specifies consolidated metadata and fixed length strings, format 3 does not yet
+        ds.to_zarr(store, mode='w', encoding=tools.zarr_encoding(ds, pack=pack), consolidated=True, zarr_format=2)
+        update_attrs(store, merge_datasets.attrs_from_summaries([summary]))
+        return True
+
+    with xr.open_zarr(store) as ds_store:
+        ds = on_depth_grid(ds, ds_store.DEPTH.values)
+        attrs = ds_store.attrs
+        ### all cruises need the same variables to be appended
+        extra = [var for var in ds.data_vars if var not in ds_store.data_vars]
+        if extra:
+            print(f"Warning: the variables {extra} of {gc_string} are not in {store} and are dropped.")
+            ds = ds.drop_vars(extra)
+        for var in ds_store.data_vars:
+            if var not in ds.data_vars:
+                dims = ds_store[var].dims
+                ds[var] = (dims, np.full([ds.sizes[dim] for dim in dims], np.nan))
+                ds[var].attrs = ds_store[var].attrs
+    ### the attributes of the store are updated below
+    ds.attrs = {}
+    ds.to_zarr(store, append_dim='DATETIME', consolidated=True)
+    update_attrs(store, merge_datasets.attrs_from_summaries([summary_from_attrs(attrs), summary]))
+    return True
+
+def append_years(merge_dir, store, grid=None, pack=False):
+    '''
+    Append the merged datasets of all years which are not yet in a Zarr store, in order of time (requires zarr).
+    The cast index of the store is updated, see cast_index.select_casts.
+
+    Parameters
+    ----------
+    merge_dir : str
+        The path to the directory containing the merged datasets of different years
+    store : str
+        The path to the Zarr store
+    grid : np.ndarray(optional)
+        The DEPTH grid of the store in m, only used when the store is created. Defaults to the depth_grid of the
+        configuration, see regrid.standard_grid
+    pack : bool(optional)
+        Pack the variables into int16 where the encoding policy allows it, only used when the store is created
+
+    Returns
+    -------
+    list
+        The GC strings of the appended cruises
+    '''
+    stored = stored_cruises(store)
+    datasets = []
+    for path in merge_datasets.merged_files(merge_dir):
+        ds = xr.open_dataset(path)
+        if str(ds.GC_STRING.values[0]) in stored:
+            ds.close()
+        else:
+            datasets.append(ds)
+    appended = []
+    for ds in sorted(datasets, key=lambda x: x.DATETIME.values.min()):
+        if append_cruise(ds, store, grid, pack):
+            appended.append(str(ds.GC_STRING.values[0]))
+        ds.close()
+    if appended:
+        cast_index.write_cast_index(store)
+    return appended
+
+def open_store(store, chunks=None):
+    '''
+    Open a Zarr store lazily as dask arrays (requires zarr and dask).
+
+    Parameters
+    ----------
+    store : str
+        The path to the Zarr store
+    chunks : dict(optional)
+        The chunks of the dask arrays, defaults to the chunks of the store
+
+    Returns
+    -------
+    xarray.Dataset
+        The dataset of all cruises in the store, in the order they were appended
+    '''
+    return xr.open_zarr(store, chunks={} if chunks is None else chunks, consolidated=True)
@@ -0,0 +1,107 @@
+'''
+Benchmarks of the ingest pipeline for asv (https://asv.readthedocs.io), run on synthetic archives.
+
+Every stage is timed (time_*) and its peak memory is measured (peakmem_*).
+'''
+import os
+import tempfile
+import warnings
+from WBTSdata import load_cal_files, load_vel_files, merge_datasets, pipeline, tools
+from . import synthetic
+
+warnings.filterwarnings('ignore')
+
+### synthetic archives written in this process, keyed by their parameters
+_archives = {}
+
+
+def archive(cruise, n_casts, dz, depth=2000):
+    '''
+    Write a synthetic archive with one cruise, reusing it within the same process.
+
+    Returns
+    -------
+    tuple
+        The input_dir, the cal_dir and the vel_dir of the cruise
+    '''
+    key = (cruise, n_casts, dz, depth)
+    if key not in _archives:
+        input_dir = tempfile.mkdtemp(prefix='wbts_bench_')
+        (_, cal_dir, vel_dir), = synthetic.write_archive(input_dir, n_casts, int(depth / dz), dz, [cruise])
+        _archives[key] = (input_dir, cal_dir, vel_dir)
+    return _archives[key]
+
+
+class Cruise:
+    '''
+    The stages of the ingest of a single cruise.
+    '''
+    params = (['2005_05', '2009_04'], [25, 70], [2.0, 1.0])
+    param_names = ['cruise', 'n_casts', 'dz']
+    timeout = 600
+
+    def setup(self, cruise, n_casts, dz):
+        input_dir, self.cal_dir, self.vel_dir = archive(cruise, n_casts, dz)
+        self.config = dict(tools.get_config(), input_dir=input_dir)
+
+    def time_load_cal_casts(self, *params):
+        load_cal_files.load_cal_casts(self.cal_dir)
+
+    def peakmem_load_cal_casts(self, *params):
+        load_cal_files.load_cal_casts(self.cal_dir)
+
+    def time_create_coordinates_CTD(self, *params):
+        load_cal_files.create_coordinates(self.cal_dir)
+
+    def time_load_vel_casts(self, *params):
+        load_vel_files.load_vel_casts(self.vel_dir)
+
+    def time_create_coordinates_ADCP(self, *params):
+        load_vel_files.create_coordinates(self.vel_dir)
+
+    def time_create_Dataset_CTD(self, *params):
+        load_cal_files.create_Dataset(self.cal_dir, self.config)
+
+    def peakmem_create_Dataset_CTD(self, *params):
+        load_cal_files.create_Dataset(self.cal_dir, self.config)
+
+    def time_create_Dataset_ADCP(self, *params):
+        load_vel_files.create_Dataset(self.vel_dir, self.config)
+
+    def peakmem_create_Dataset_ADCP(self, *params):
+        load_vel_files.create_Dataset(self.vel_dir, self.config)
+
+    def time_merge_datasets(self, *params):
+        merge_datasets.merge_datasets(self.cal_dir, self.vel_dir, self.config)
+
+    def peakmem_merge_datasets(self, *params):
+        merge_datasets.merge_datasets(self.cal_dir, self.vel_dir, self.config)
+
+
+class MergeYears:
+    '''
+    Merging the merged files of several cruises into the dataset of all years.
+    '''
+    params = [False, True]
+    param_names = ['lazy']
+    timeout = 600
+
+    def setup_cache(self):
+        input_dir = tempfile.mkdtemp(prefix='wbts_bench_')
+        output_dir = tempfile.mkdtemp(prefix='wbts_bench_out_')
+        synthetic.write_archive(input_dir, n_casts=50, n_levels=1000, dz=2.0)
+        pipeline.build_archive(input_dir, output_dir, workers=1, build=('Merged',))
+        return output_dir
+
+    def time_merge_years(self, output_dir, lazy):
+        merge_datasets.merge_years(output_dir, lazy=lazy).load()
+
+    def peakmem_merge_years(self, output_dir, lazy):
+        merge_datasets.merge_years(output_dir, lazy=lazy).load()
+
+    def time_write_all_years(self, output_dir, lazy):
+        path = os.path.join(output_dir, 'all_years.nc')
+        if lazy:
+            merge_datasets.write_all_years(output_dir, path)
+        else:
+            merge_datasets.merge_years(output_dir).to_netcdf(path)
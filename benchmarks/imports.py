@@ -0,0 +1,97 @@
+'''
+Import times of the package, measured in a fresh interpreter.
+
+The worker processes of pipeline.build_archive and the wbtsdata command pay these costs on every start.
+check_imports compares them with import_budget and checks that the modules in deferred_modules are only
+imported by the functions which need them.
+'''
+import sys
+import json
+import subprocess
+
+### maximum import time in seconds of the modules
+import_budget = {
+    'WBTSdata': 0.05,
+    'WBTSdata.cli': 0.1,
+    'WBTSdata.plotters': 0.5,
+    'WBTSdata.pipeline': 1.5,
+}
+### heavy modules which must not be imported with the package
+deferred_modules = ['matplotlib', 'gsw', 'scipy', 'zarr', 'cartopy', 'cmocean', 'seaborn']
+
+_measure = '''
+import sys, time, json
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': [m for m in {deferred!r} if m in sys.modules]}}))
+'''
+
+
+def import_time(module, deferred=deferred_modules):
+    '''
+    Import a module in a fresh interpreter.
+
+    Parameters
+    ----------
+    module : str
+        The name of the module
+    deferred : list(optional)
+        The modules which should not be imported with it
+
+    Returns
+    -------
+    dict
+        The import time in 'seconds' and the deferred modules which were 'loaded'
+    '''
+    code = _measure.format(module=module, deferred=list(deferred))
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+def check_imports(budget=import_budget, repeat=3):
+    '''
+    Check the import times against the budget, taking the fastest of several runs.
+
+    Parameters
+    ----------
+    budget : dict(optional)
+        The maximum import time in seconds of each module
+    repeat : int(optional)
+        The number of imports of each module
+
+    Returns
+    -------
+    list
+        The messages of the violations, empty if all modules are within the budget
+    '''
+    violations = []
+    for module, limit in budget.items():
+        results = [import_time(module) for _ in range(repeat)]
+        seconds = min(r['seconds'] for r in results)
+        print(f"{module:<24}{seconds:>10.3f} s   budget {limit:.3f} s")
+        if seconds > limit:
+            violations.append(f"importing {module} takes {seconds:.3f} s, the budget is {limit:.3f} s")
+        if results[0]['loaded']:
+            violations.append(f"importing {module} loads {', '.join(results[0]['loaded'])}")
+    return violations
+
+
+class Import:
+    '''
+    The import times of the modules used by the workers and the command line, for asv.
+    '''
+    def timeraw_import_package(self):
+        return 'import WBTSdata'
+
+    def timeraw_import_cli(self):
+        return 'import WBTSdata.cli'
+
+    def timeraw_import_pipeline(self):
+        return 'import WBTSdata.pipeline'
+
+
+if __name__ == '__main__':
+    violations = check_imports()
+    for violation in violations:
+        print(violation)
+    sys.exit(1 if violations else 0)
@@ -0,0 +1,70 @@
+'''
+Run the ingest stages once on a synthetic archive and report time and peak memory, without asv.
+
+    python -m benchmarks.run --n-casts 70 --dz 1 --cruise 2005_05 2009_04
+'''
+import os
+import time
+import argparse
+import tempfile
+import tracemalloc
+import warnings
+from WBTSdata import load_cal_files, load_vel_files, merge_datasets, pipeline, tools
+from . import synthetic
+
+
+def measure(func, *args, **kwargs):
+    '''
+    Call func and measure its wall time and the peak of the memory allocated by Python and numpy.
+
+    Returns
+    -------
+    tuple
+        The time in seconds and the peak memory in MB
+    '''
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak / 2**20
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--n-casts', type=int, default=50, help='number of casts per cruise')
+    parser.add_argument('--dz', type=float, default=2.0, help='CTD pressure resolution in dbar')
+    parser.add_argument('--depth', type=float, default=2000, help='depth of the casts in dbar')
+    parser.add_argument('--cruise', nargs='+', default=synthetic.default_cruises, help='cruises to create')
+    args = parser.parse_args(argv)
+    warnings.filterwarnings('ignore')
+
+    with tempfile.TemporaryDirectory(prefix='wbts_bench_') as tmp_dir:
+        run(os.path.join(tmp_dir, 'input'), os.path.join(tmp_dir, 'output'), args)
+
+def run(input_dir, output_dir, args):
+    dirs = synthetic.write_archive(input_dir, args.n_casts, int(args.depth / args.dz), args.dz, args.cruise)
+    config = dict(tools.get_config(), input_dir=input_dir)
+
+    print(f"{'stage':<46}{'time [s]':>10}{'peak [MB]':>12}")
+    for cruise, cal_dir, vel_dir in dirs:
+        stages = [
+            ('load_cal_casts', load_cal_files.load_cal_casts, (cal_dir,)),
+            ('load_cal_files.create_coordinates', load_cal_files.create_coordinates, (cal_dir,)),
+            ('load_vel_casts', load_vel_files.load_vel_casts, (vel_dir,)),
+            ('load_vel_files.create_coordinates', load_vel_files.create_coordinates, (vel_dir,)),
+            ('load_cal_files.create_Dataset', load_cal_files.create_Dataset, (cal_dir, config)),
+            ('load_vel_files.create_Dataset', load_vel_files.create_Dataset, (vel_dir, config)),
+            ('merge_datasets', merge_datasets.merge_datasets, (cal_dir, vel_dir, config)),
+        ]
+        for name, func, func_args in stages:
+            seconds, peak = measure(func, *func_args)
+            print(f"{cruise + ' ' + name:<46}{seconds:>10.3f}{peak:>12.1f}")
+
+    pipeline.build_archive(input_dir, output_dir, workers=1, build=('Merged',), config=config)
+    for lazy in [False, True]:
+        seconds, peak = measure(lambda: merge_datasets.merge_years(output_dir, lazy=lazy).load())
+        print(f"{'merge_years lazy=' + str(lazy):<46}{seconds:>10.3f}{peak:>12.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import os
+import numpy as np
+
+### cruises of config.yaml used for the synthetic archive. 2005_05 uses the dates and times of
+### missing_datetime_2005_05, 2009_04 is within the years whose CTD times are corrected.
+default_cruises = ['2005_05', '2009_04', '2018_11']
+
+
+def write_cal_file(path, cast, cruise, n_levels, dz, rng):
+    '''
+    Write a synthetic .cal file with a 12-line header.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file
+    cast : int
+        The Cast number
+    cruise : str
+        The 'YYYY_MM' string of the cruise
+    n_levels : int
+        The number of pressure levels
+    dz : float
+        The pressure resolution in dbar
+    rng : np.random.Generator
+        The random number generator
+    '''
+    yy, mm = cruise[2:4], int(cruise[5:7])
+    day = 1 + cast % 28
+    ### the three date formats found in the archive: 6, 7 and 8 tokens in the second header line
+    date = [f"{mm:02d}/{day:02d}/{yy}", f"{mm:02d}/{day:02d}/ {int(yy)}", f"{mm}/ {day}/ {int(yy)}"][cast % 3]
+    time = [2050, 5, 130, 1205][cast % 4]
+    lat = 26.5 + 0.01 * rng.random()
+    lon = f"{-77 + 0.05 * cast:.3f}" + ('-735234' if cruise == '2005_05' else '')
+    lines = [f"{cruise} cast {cast}", f"{cast:3d} {lat:.3f} {lon} {n_levels} {date} {time}"]
+    lines += ['header'] * 10
+    pr = np.arange(n_levels) * dz + dz * (cast % 3) / 3
+    te = 25 - pr / 100 + rng.normal(0, 0.01, n_levels)
+    block = np.column_stack([pr, te, te - 0.1, np.full(n_levels, 36.1), pr / 10, np.full(n_levels, 26.1),
+                             np.full(n_levels, 200.0)])
+    with open(path, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+        np.savetxt(file, block, fmt='%10.4f')
+
+def write_vel_file(path, cast, cruise, n_levels, dz, rng):
+    '''
+    Write a synthetic .vel file with a 74-line LADCP header.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file
+    cast : int
+        The Cast number
+    cruise : str
+        The 'YYYY_MM' string of the cruise
+    n_levels : int
+        The number of depth levels
+    dz : float
+        The depth resolution in m
+    rng : np.random.Generator
+        The random number generator
+    '''
+    yy, mm = cruise[2:4], int(cruise[5:7])
+    lines = ['header'] * 74
+    lines[19] = 'Configuration: DL'
+    lines[21] = f"Station: ab{yy}{mm:02d}_{cast:03d}" + ('N' if cast % 2 else '')
+    for i, minute in zip([25, 35, 45], [30, 0, 59]):
+        lines[i] = f"Latitude: {26.5 + 0.01 * rng.random():.4f}"
+        lines[i+1] = f"Longitude: {-77 + 0.05 * cast:.4f}"
+        lines[i+2] = f"Date: {mm:02d}/{1 + cast % 28:02d}/{yy}"
+        lines[i+3] = f"Time: {cast % 24:02d}:{minute:02d}:00"
+    z = (np.arange(n_levels) + 1) * dz
+    block = np.column_stack([z, rng.normal(0, 20, n_levels), rng.normal(0, 20, n_levels),
+                             np.abs(rng.normal(0, 2, n_levels))])
+    with open(path, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+        np.savetxt(file, block, fmt=['%6d', '%8.2f', '%8.2f', '%6.2f'])
+
+def write_archive(input_dir, n_casts=50, n_levels=1000, dz=2.0, cruises=default_cruises, seed=0):
+    '''
+    Write a synthetic raw WBTS archive with the directory layout of the real one.
+
+    Parameters
+    ----------
+    input_dir : str
+        The directory of the archive
+    n_casts : int(optional)
+        The number of casts per cruise, at most 71 for 2005_05 whose times are taken from missing_datetime_2005_05
+    n_levels : int(optional)
+        The number of CTD pressure levels per cast, the LADCP casts have a tenth of the levels
+    dz : float(optional)
+        The CTD pressure resolution in dbar, the LADCP depth resolution is ten times coarser
+    cruises : list(optional)
+        The 'YYYY_MM' strings of the cruises
+    seed : int(optional)
+        The seed of the random number generator
+
+    Returns
+    -------
+    list
+        A list of (cruise, cal_dir, vel_dir) tuples
+    '''
+    rng = np.random.default_rng(seed)
+    dirs = []
+    for cruise in cruises:
+        cal_dir = os.path.join(input_dir, 'GC_' + cruise, 'CTD')
+        vel_dir = os.path.join(input_dir, 'GC_' + cruise, 'FINAL_ADCP_PRODUCTS', 'ladcp_velfiles')
+        os.makedirs(cal_dir, exist_ok=True)
+        os.makedirs(vel_dir, exist_ok=True)
+        yymm = cruise[2:4] + cruise[5:7]
+        for cast in range(1, n_casts + 1):
+            write_cal_file(os.path.join(cal_dir, f"ab{yymm}{cast:03d}.cal"), cast, cruise, n_levels, dz, rng)
+            write_vel_file(os.path.join(vel_dir, f"ab{yymm}_{cast:03d}.vel"), cast, cruise,
+                           max(n_levels // 10, 1), 10 * dz, rng)
+        dirs.append((cruise, cal_dir, vel_dir))
+    return dirs
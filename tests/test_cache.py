@@ -0,0 +1,29 @@
+import warnings
+import numpy as np
+import netCDF4
+import xarray as xr
+from WBTSdata import cache, tools
+from benchmarks import synthetic
+
+warnings.filterwarnings('ignore')
+
+
+def test_disk_tier(tmp_path):
+    (_, cal_dir, vel_dir), = synthetic.write_archive(str(tmp_path / 'raw'), n_casts=3, n_levels=40,
+                                                     cruises=['2009_04'])
+    config = tools.get_config()
+    datasets = cache.DatasetCache(cache_dir=str(tmp_path / 'cache'))
+    ds = datasets.cruise(cal_dir, vel_dir, 'Merged', config)
+    assert datasets.info()['misses'] == 1
+
+    ### a new session reads the dataset from the NetCDF file written with the encoding policy
+    session = cache.DatasetCache(cache_dir=str(tmp_path / 'cache'))
+    ds_disk = session.cruise(cal_dir, vel_dir, 'Merged', config)
+    assert session.info()['disk_hits'] == 1
+    (path,) = (tmp_path / 'cache').glob('*.nc')
+    with netCDF4.Dataset(path) as nc:
+        assert nc['TEMP'].dtype == np.float32
+        assert nc['TIME_FLAG'].dtype == np.int8
+        assert nc['TEMP'].chunking() != 'contiguous'
+    for var in ['TEMP', 'PSAL', 'U_WATER_VELOCITY', 'TIME_FLAG', 'CAST_NUMBER']:
+        xr.testing.assert_allclose(ds_disk[var], ds[var].astype(ds_disk[var].dtype))
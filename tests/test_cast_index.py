@@ -0,0 +1,45 @@
+import os
+import warnings
+import numpy as np
+import pytest
+import xarray as xr
+from WBTSdata import cast_index, merge_datasets, pipeline, tools, zarr_store
+from benchmarks import synthetic
+
+warnings.filterwarnings('ignore')
+
+
+@pytest.fixture(scope='module')
+def merge_dir(tmp_path_factory):
+    '''
+    The padded merged files of three synthetic cruises.
+    '''
+    root = tmp_path_factory.mktemp('merged')
+    os.makedirs(root / 'Merged')
+    config = tools.get_config()
+    for year, cal_dir, vel_dir in synthetic.write_archive(str(root / 'raw'), n_casts=5, n_levels=40):
+        merge_datasets.merge_datasets(cal_dir, vel_dir, config).to_netcdf(pipeline.output_path(str(root), year, 'Merged'))
+    return str(root)
+
+
+def test_index_path():
+    assert cast_index.index_path('Merged/WBTS_all_years_CTD_LADCP.nc') != \
+        cast_index.index_path('Merged/WBTS_all_years_CTD_LADCP.zarr/')
+
+def test_netcdf_and_zarr_indexes(merge_dir):
+    pytest.importorskip('zarr')
+    path_nc = merge_datasets.write_all_years(merge_dir)
+    path_zarr = os.path.join(merge_dir, 'Merged', 'WBTS_all_years_CTD_LADCP.zarr')
+    zarr_store.append_years(merge_dir, path_zarr, grid=np.arange(0, 200, 2.0))
+
+    for path in [path_nc, path_zarr]:
+        index = cast_index.load_cast_index(path)
+        with xr.open_dataset(path) as ds:
+            np.testing.assert_array_equal(index['CAST_NUMBER'], ds['CAST_NUMBER'].values)
+            assert index['GC_STRING'] == ds['GC_STRING'].values.astype(str).tolist()
+            encoding = ds['TEMP'].encoding
+            chunk = encoding.get('chunksizes') or (encoding['preferred_chunks']['DATETIME'],)
+            assert index['chunk_size'] == chunk[0]
+        selected = cast_index.select_casts(path, cruise='GC_2009_04')
+        assert set(selected['GC_STRING'].values.astype(str)) == {'GC_2009_04'}
+        assert selected.sizes['DATETIME'] == 5
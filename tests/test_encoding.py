@@ -0,0 +1,25 @@
+import numpy as np
+import xarray as xr
+from WBTSdata import tools
+
+
+def test_integer_policy_of_float_variables(tmp_path):
+    ds = xr.Dataset({'TIME_FLAG': ('DATETIME', [0.0, 1.0, np.nan]),
+                     'CAST_NUMBER': ('DATETIME', [1.0, 2.0, 300.0]),
+                     'TEMP': ('DATETIME', [20.5, np.nan, 4.25])})
+    encoding = tools.netcdf_encoding(ds)
+    assert encoding['TIME_FLAG']['dtype'] == 'int8'
+    assert encoding['CAST_NUMBER']['dtype'] == 'int16'
+    assert encoding['TEMP']['dtype'] == 'float32'
+
+    path = str(tmp_path / 'encoded.nc')
+    tools.write_netcdf(ds, path)
+    with xr.open_dataset(path) as ds_file:
+        assert ds_file['TIME_FLAG'].encoding['dtype'] == np.int8
+        xr.testing.assert_equal(ds_file, ds)
+
+def test_integer_policy_falls_back_to_float():
+    ds = xr.Dataset({'TIME_FLAG': ('DATETIME', [0.5, 1.0]), 'CAST_NUMBER': ('DATETIME', [1.0, 1e6])})
+    encoding = tools.netcdf_encoding(ds)
+    assert encoding['TIME_FLAG']['dtype'] == 'float32'
+    assert encoding['CAST_NUMBER']['dtype'] == 'float32'
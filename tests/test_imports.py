@@ -0,0 +1,27 @@
+import os
+import pytest
+from benchmarks import imports
+
+### the imports run in fresh interpreters, which find the package in the root of the repository
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def in_root(monkeypatch):
+    monkeypatch.chdir(root)
+
+
+@pytest.mark.parametrize('module', list(imports.import_budget) + ['WBTSdata.merge_datasets'])
+def test_deferred_modules(module):
+    result = imports.import_time(module)
+    print(f"{module}: {result['seconds']:.3f} s")
+    assert result['loaded'] == []
+
+def test_merge_datasets_defers_heavy_modules():
+    loaded = imports.import_time('WBTSdata.merge_datasets', ['matplotlib', 'scipy', 'gsw'])['loaded']
+    assert loaded == []
+
+@pytest.mark.benchmark
+def test_import_budget():
+    ### wall-clock limits depend on the machine, run with: python -m pytest -m benchmark
+    assert imports.check_imports() == []
@@ -0,0 +1,45 @@
+import os
+import json
+import warnings
+import numpy as np
+from WBTSdata import instrumentation, pipeline, load_cal_files, load_vel_files
+from benchmarks import synthetic
+
+warnings.filterwarnings('ignore')
+
+
+def test_stage_records_memory_of_the_stage():
+    with instrumentation.collect('GC_2009_04') as records:
+        with instrumentation.stage('build') as record:
+            values = np.ones(2**24)
+            values.sum()
+        del values
+        with instrumentation.stage('write'):
+            pass
+    build, write = records
+    assert build['cruise'] == 'GC_2009_04'
+    if build['rss'] is not None:
+        ### the 128 MiB of the array are counted in the stage which allocated them, not in the next one
+        assert build['rss_change'] > 2**26
+        assert write['rss_change'] < 2**26
+        assert write['peak_rss'] >= build['peak_rss']
+
+def test_report_includes_discover(tmp_path):
+    synthetic.write_archive(str(tmp_path / 'raw'), n_casts=3, n_levels=40, cruises=['2009_04'])
+    report_path = str(tmp_path / 'report.json')
+    pipeline.build_archive(str(tmp_path / 'raw'), str(tmp_path / 'out'), workers=1, build=('CTD',),
+                           report_path=report_path)
+    with open(report_path) as file:
+        report = json.load(file)
+    assert [(r['stage'], r['cruises']) for r in report['stages']] == [('discover', 1)]
+    assert [r['cruise'] for r in report['cruises']] == ['GC_2009_04']
+    assert 'write' in [r['stage'] for r in report['cruises'][0]['stages']]
+
+def test_bytes_read(tmp_path):
+    (_, cal_dir, vel_dir), = synthetic.write_archive(str(tmp_path), n_casts=3, n_levels=40, cruises=['2009_04'])
+    with instrumentation.collect() as records:
+        load_cal_files.load_cal_casts(cal_dir, threads=2)
+        load_vel_files.load_vel_casts(vel_dir, threads=2)
+        load_vel_files.load_vel_casts(vel_dir, use_mmap=True)
+    sizes = [instrumentation.files_size([os.path.join(d, f) for f in os.listdir(d)]) for d in [cal_dir, vel_dir, vel_dir]]
+    assert [r['bytes'] for r in records if r['stage'] == 'parse_bodies'] == sizes
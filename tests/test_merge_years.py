@@ -0,0 +1,35 @@
+import os
+import sys
+import warnings
+import pytest
+import xarray as xr
+from WBTSdata import cli, merge_datasets, pipeline, tools
+from benchmarks import synthetic
+
+warnings.filterwarnings('ignore')
+
+
+@pytest.fixture(scope='module')
+def merge_dir(tmp_path_factory):
+    '''
+    The padded merged files of two synthetic cruises.
+    '''
+    root = tmp_path_factory.mktemp('merged')
+    os.makedirs(root / 'Merged')
+    config = tools.get_config()
+    for year, cal_dir, vel_dir in synthetic.write_archive(str(root / 'raw'), n_casts=4, n_levels=60,
+                                                          cruises=['2009_04', '2018_11']):
+        ds = merge_datasets.merge_datasets(cal_dir, vel_dir, config)
+        ds.to_netcdf(pipeline.output_path(str(root), year, 'Merged'))
+    return str(root)
+
+
+@pytest.mark.parametrize('dask_installed', [True, False])
+def test_merge_years_command(merge_dir, tmp_path, monkeypatch, dask_installed):
+    if not dask_installed:
+        ### a None entry in sys.modules makes the import fail with ImportError
+        monkeypatch.setitem(sys.modules, 'dask', None)
+    path = str(tmp_path / 'all_years.nc')
+    assert cli.main(['merge-years', '--output-dir', merge_dir, '--path', path]) == 0
+    with xr.open_dataset(path) as ds_file:
+        xr.testing.assert_allclose(ds_file['TEMP'], merge_datasets.merge_years(merge_dir)['TEMP'])
@@ -0,0 +1,91 @@
+import datetime
+import numpy as np
+import pytest
+from WBTSdata import load_cal_files, tools
+from WBTSdata import missing_datetime_2005_05 as mdt
+
+
+def per_file_coordinates(sl, file_name):
+    '''
+    The normalisation of the second header line of a .cal file as done file by file before parse_cal_headers,
+    returning the Cast number, latitude, longitude, datetime string and time flag.
+    '''
+    sl = list(sl)
+    if len(sl) == 7:
+        if len(sl[5]) < 2:
+            sl[5] = '0' + sl[5]
+        if len(sl[4]) < 2:
+            sl[4] = '0' + sl[4]
+        sl[4] = sl[4] + sl[5]
+        sl.pop(5)
+    if len(sl) == 8:
+        if len(sl[4]) < 2:
+            sl[4] = '0' + sl[4]
+        if len(sl[5]) < 2:
+            sl[5] = '0' + sl[5]
+        if len(sl[6]) < 2:
+            sl[6] = '0' + sl[6]
+        sl[4] = sl[4] + sl[5] + sl[6]
+        sl.pop(5)
+        sl.pop(5)
+    time_flag = 0
+    year = file_name[2:6]
+    if 505 == int(year):
+        time_flag = 2
+        sl[2] = sl[2].replace('-735234', '')
+        sl[3] = '0'
+        sl[4] = mdt.dates()[int(file_name[7:9])]
+        sl[5] = mdt.times()[int(file_name[7:9])]
+    if 703 < int(year) < 1705:
+        if len(sl[5]) == 3:
+            if int(sl[5][-2:]) > 59:
+                sl[5] = sl[5][:2] + '0' + sl[5][2]
+            elif 0 < int(sl[5][-3]) < 3:
+                time_flag = 1
+        elif len(sl[5]) == 2:
+            if int(sl[5][-2:]) > 59:
+                sl[5] = sl[5][0] + '0' + sl[5][1]
+    for _ in range(3):
+        if len(sl[5]) < 4:
+            sl[5] = '0' + sl[5]
+    Datetime = datetime.datetime.strptime(sl[4] + sl[5], '%m/%d/%y%H%M').strftime('%Y-%m-%d %H:%M:%S')
+    return [int(sl[0]), float(sl[1]), float(sl[2]), Datetime, time_flag]
+
+### the second header lines and file names of casts covering every branch of the normalisation
+headers = [
+    ### 6 tokens with 4, 3, 2 and 1 digit times, before, inside and after the years with corrected times
+    (['1', '26.512', '-76.950', '500', '04/15/09', '1205'], 'ab0904001.cal'),
+    (['2', '26.512', '-76.900', '500', '04/15/09', '175'], 'ab0904002.cal'),
+    (['3', '26.512', '-76.850', '500', '04/15/09', '130'], 'ab0904003.cal'),
+    (['4', '26.512', '-76.800', '500', '04/15/09', '930'], 'ab0904004.cal'),
+    (['5', '26.512', '-76.750', '500', '04/15/09', '75'], 'ab0904005.cal'),
+    (['6', '26.512', '-76.700', '500', '04/15/09', '45'], 'ab0904006.cal'),
+    (['7', '26.512', '-76.650', '500', '04/15/09', '5'], 'ab0904007.cal'),
+    (['8', '26.512', '-76.600', '500', '03/02/07', '130'], 'ab0703008.cal'),
+    (['9', '26.512', '-76.550', '500', '11/30/18', '130'], 'ab1811009.cal'),
+    ### 7 tokens, the year split off with and without a leading zero
+    (['10', '26.5', '-76.5', '500', '04/15/', '9', '2050'], 'ab0904010.cal'),
+    (['11', '26.5', '-76.5', '500', '04/15/', '09', '2050'], 'ab0904011.cal'),
+    ### 8 tokens, month, day and year split
+    (['12', '26.5', '-76.5', '500', '4/', '5/', '9', '130'], 'ab0904012.cal'),
+    (['13', '26.5', '-76.5', '500', '12/', '25/', '10', '2359'], 'ab1012013.cal'),
+    ### May 2005, date and time from the cruise report and the longitude fixed
+    (['17', '26.5', '-76.500-735234', '500', '05/07/05', '0'], 'ab0505017.cal'),
+    (['3', '26.5', '-77.000-735234', '500', '05/04/', '5', '0'], 'ab0505003.cal'),
+]
+
+
+def test_matches_per_file_algorithm():
+    tokens, file_names = zip(*headers)
+    Cast, Lat, Lon, Datetime, time_flag = load_cal_files.parse_cal_headers(list(tokens), list(file_names))
+    parsed = [[c, lat, lon, tools.datetime_string(t), flag]
+              for c, lat, lon, t, flag in zip(Cast.tolist(), Lat.tolist(), Lon.tolist(), Datetime, time_flag.tolist())]
+    expected = [per_file_coordinates(sl, name) for sl, name in headers]
+    assert parsed == expected
+
+@pytest.mark.parametrize('sl, file_name', headers)
+def test_single_header(sl, file_name):
+    Cast, Lat, Lon, Datetime, time_flag = load_cal_files.parse_cal_headers([sl], [file_name])
+    assert [Cast[0], Lat[0], Lon[0], tools.datetime_string(Datetime[0]), time_flag[0]] == \
+        per_file_coordinates(sl, file_name)
+    assert Datetime.dtype == np.dtype('datetime64[ns]')
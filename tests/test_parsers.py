@@ -0,0 +1,77 @@
+import os
+import datetime
+import tracemalloc
+import numpy as np
+import pytest
+from WBTSdata import load_cal_files, load_vel_files
+from benchmarks import synthetic
+
+
+@pytest.fixture(scope='module')
+def cruise(tmp_path_factory):
+    (_, cal_dir, vel_dir), = synthetic.write_archive(str(tmp_path_factory.mktemp('raw')), n_casts=6, n_levels=50,
+                                                     cruises=['2009_04'])
+    return cal_dir, vel_dir
+
+def files(directory, extension):
+    return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(extension))
+
+
+def test_parse_cal_file(cruise):
+    for path in files(cruise[0], '.cal'):
+        with open(path, 'rb') as file:
+            tokens, data = load_cal_files.parse_cal_file(file.read())
+        with open(path) as file:
+            lines = file.read().splitlines()
+        assert tokens == lines[1].split()
+        np.testing.assert_array_equal(data, np.loadtxt(path, skiprows=load_cal_files.header_lines))
+        assert data.shape == (50, len(load_cal_files.column_names))
+        np.testing.assert_array_equal(load_cal_files.read_cal_file(path)[1], data)
+        assert load_cal_files.read_cal_header(path) == tokens
+
+def test_parse_vel_header(cruise):
+    for path in files(cruise[1], '.vel'):
+        with open(path, 'rb') as file:
+            buf = file.read()
+        header, body = load_vel_files.parse_vel_header(buf)
+        lines = buf.decode('utf-8').splitlines()
+        ### the Station line ends with the Cast number, followed by N in some files
+        assert header.cast == int(lines[21].split('_')[-1].rstrip('N'))
+        assert header.configuration == 'DL'
+        for position, i in zip([header.avg, header.start, header.end], [25, 35, 45]):
+            assert position.lat == float(lines[i].split()[-1])
+            assert position.lon == float(lines[i+1].split()[-1])
+            assert position.datetime == datetime.datetime.strptime(lines[i+2].split()[-1] + lines[i+3].split()[-1],
+                                                                   '%m/%d/%y%H:%M:%S')
+        assert bytes(body) == '\n'.join(lines[load_vel_files.header_lines:]).encode('utf-8') + b'\n'
+        assert load_vel_files.read_vel_header(path) == header
+
+def test_parse_vel_table(cruise):
+    for path in files(cruise[1], '.vel'):
+        expected = np.loadtxt(path, skiprows=load_vel_files.header_lines)
+        with open(path, 'rb') as file:
+            header, body = load_vel_files.parse_vel_header(file.read())
+        np.testing.assert_array_equal(load_vel_files.parse_vel_table(body), expected)
+        for use_mmap in [False, True]:
+            cast = load_vel_files.read_vel_file(path, use_mmap)
+            assert cast.header == header
+            np.testing.assert_array_equal(cast.data, expected)
+
+def test_short_vel_header():
+    with pytest.raises(ValueError, match='shorter'):
+        load_vel_files.parse_vel_header(b'header\n' * 10)
+
+def test_table_stream_does_not_copy(cruise):
+    path = files(cruise[1], '.vel')[0]
+    with open(path, 'rb') as file:
+        buf = file.read() * 50
+    header, body = load_vel_files.parse_vel_header(buf)
+    offset = len(buf) - len(body)
+    tracemalloc.start()
+    try:
+        stream = load_vel_files.table_stream(buf, body)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < len(buf) / 10
+    assert stream.read() == buf[offset:]
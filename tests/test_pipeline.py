@@ -0,0 +1,32 @@
+import os
+import warnings
+import numpy as np
+import xarray as xr
+from WBTSdata import cli, pipeline, regrid, tools
+from benchmarks import synthetic
+
+warnings.filterwarnings('ignore')
+
+
+def test_regrid_option(tmp_path, monkeypatch):
+    input_dir, output_dir = str(tmp_path / 'raw'), str(tmp_path / 'out')
+    synthetic.write_archive(input_dir, n_casts=3, n_levels=40, cruises=['2009_04'])
+    config = dict(tools.get_config(), depth_grid={'start': 0, 'stop': 100, 'step': 5})
+    monkeypatch.setattr(tools, 'get_config', lambda *args, **kwargs: config)
+    path = pipeline.output_path(output_dir, '2009_04', 'Merged')
+    command = ['build-merged', '--input-dir', input_dir, '--output-dir', output_dir, '--workers', '1',
+               '--incremental']
+
+    assert cli.main(command + ['--regrid']) == 0
+    with xr.open_dataset(path) as ds:
+        np.testing.assert_array_equal(ds['DEPTH'].values, regrid.standard_grid(config))
+    ### an unchanged grid is up to date, a changed grid or no grid builds the file again
+    assert pipeline.build_archive(input_dir, output_dir, workers=1, build=('Merged',), config=config,
+                                  incremental=True, depth_grid=regrid.standard_grid(config))[0]['skipped']
+    config['depth_grid'] = {'start': 0, 'stop': 100, 'step': 10}
+    assert cli.main(command + ['--regrid']) == 0
+    with xr.open_dataset(path) as ds:
+        assert ds.sizes['DEPTH'] == 11
+    assert cli.main(command) == 0
+    with xr.open_dataset(path) as ds:
+        assert 'PRES' not in ds.data_vars
@@ -0,0 +1,63 @@
+import os
+import warnings
+import pytest
+import xarray as xr
+from WBTSdata import load_cal_files, load_vel_files, merge_datasets, pipeline, ragged, tools
+from benchmarks import synthetic
+
+warnings.filterwarnings('ignore')
+
+
+@pytest.fixture(scope='module')
+def archive(tmp_path_factory):
+    '''
+    A synthetic archive of two cruises with short casts.
+    '''
+    return synthetic.write_archive(str(tmp_path_factory.mktemp('raw')), n_casts=4, n_levels=60,
+                                   cruises=['2009_04', '2018_11'])
+
+@pytest.fixture(scope='module')
+def config():
+    return tools.get_config()
+
+
+def test_round_trip_ctd(archive, config):
+    _, cal_dir, _ = archive[0]
+    ds = load_cal_files.create_Dataset(cal_dir, config)
+    assert ragged.to_padded(ragged.to_ragged(ds, 'PRES')).identical(ds)
+
+def test_round_trip_adcp(archive, config):
+    _, _, vel_dir = archive[0]
+    ds = load_vel_files.create_Dataset(vel_dir, config)
+    assert ragged.to_padded(ragged.to_ragged(ds, 'DEPTH')).identical(ds)
+
+def test_round_trip_merged(archive, config):
+    _, cal_dir, vel_dir = archive[0]
+    ds = merge_datasets.merge_datasets(cal_dir, vel_dir, config)
+    assert ragged.to_padded(ragged.to_ragged(ds)).identical(ds)
+
+def test_select_profiles(archive, config):
+    _, cal_dir, _ = archive[0]
+    ds = load_cal_files.create_Dataset(cal_dir, config)
+    selected = ragged.to_padded(ragged.select_profiles(ragged.to_ragged(ds, 'PRES'), [1, 2]))
+    xr.testing.assert_identical(selected, ds.isel(DATETIME=[1, 2]).dropna('PRES', how='all'))
+
+def test_merge_years_pads_ragged_files(archive, config, tmp_path):
+    ### the first cruise only has a ragged file, the second a padded and a ragged file
+    os.makedirs(tmp_path / 'Merged')
+    padded = []
+    for i, (year, cal_dir, vel_dir) in enumerate(archive):
+        ds = merge_datasets.merge_datasets(cal_dir, vel_dir, config)
+        padded.append(ds)
+        ragged.to_ragged(ds).to_netcdf(pipeline.output_path(str(tmp_path), year, 'Merged', ragged=True))
+        if i > 0:
+            ds.to_netcdf(pipeline.output_path(str(tmp_path), year, 'Merged'))
+
+    files = merge_datasets.merged_files(str(tmp_path))
+    assert [os.path.basename(f) for f in files] == ['WBTS_2009_04_CTD_LADCP_ragged.nc', 'WBTS_2018_11_CTD_LADCP.nc']
+    for lazy in [False, True]:
+        ds_all = merge_datasets.merge_years(str(tmp_path), lazy=lazy).load()
+        assert ds_all.sizes['DATETIME'] == sum(ds.sizes['DATETIME'] for ds in padded)
+        for ds in padded:
+            temp = ds_all['TEMP'].sel(DATETIME=ds.DATETIME).dropna('DEPTH', how='all')
+            xr.testing.assert_allclose(temp, ds['TEMP'].dropna('DEPTH', how='all'))
@@ -0,0 +1,66 @@
+import time
+import numpy as np
+import pandas as pd
+import xarray as xr
+from WBTSdata import load_cal_files, tools
+from benchmarks import synthetic
+
+
+def test_stack_casts():
+    columns = ['pr', 'te', 'sa']
+    data = [np.array([[0.0, 20.0, 36.0], [2.0, 19.0, 36.1]]),
+            np.array([[1.0, 21.0, 35.9], [2.0, 18.0, 36.2], [4.0, 17.0, 36.3]])]
+    times = ['2009-04-01T00:00', '2009-04-01T06:00']
+    ds = tools.stack_casts(times, data, columns, 'pr')
+    np.testing.assert_array_equal(ds['pr'].values, [0.0, 1.0, 2.0, 4.0])
+    np.testing.assert_array_equal(ds['te'].values, [[20.0, np.nan, 19.0, np.nan], [np.nan, 21.0, 18.0, 17.0]])
+    np.testing.assert_array_equal(ds['sa'].values, [[36.0, np.nan, 36.1, np.nan], [np.nan, 35.9, 36.2, 36.3]])
+    assert ds['DATETIME'].dtype == np.dtype('datetime64[ns]')
+    assert ds['te'].dims == ('DATETIME', 'pr')
+
+def test_stack_casts_matches_concat(tmp_path):
+    ### the casts of the synthetic archive are on pressure levels shifted by a third of the resolution
+    (_, cal_dir, _), = synthetic.write_archive(str(tmp_path), n_casts=5, n_levels=30, cruises=['2009_04'])
+    casts = load_cal_files.load_cal_casts(cal_dir)
+    times = [c.datetime for c in casts]
+    ds = tools.stack_casts(times, [c.data for c in casts], load_cal_files.column_names, 'pr')
+    ### the Dataset built cast by cast and concatenated with an outer join on the pressure levels
+    datasets = [xr.Dataset.from_dataframe(pd.DataFrame(c.data, columns=load_cal_files.column_names).set_index('pr'))
+                for c in casts]
+    expected = xr.concat(datasets, dim=pd.Index(np.asarray(times, dtype='datetime64[ns]'), name='DATETIME'),
+                         join='outer')
+    assert ds.sizes['pr'] == 90
+    xr.testing.assert_identical(ds, expected.transpose('DATETIME', 'pr'))
+
+def test_read_files(tmp_path, monkeypatch):
+    paths = []
+    for i in range(30):
+        paths.append(str(tmp_path / f'{i:02d}.txt'))
+        with open(paths[-1], 'wb') as file:
+            file.write(f'file {i}\n'.encode() * (i + 1))
+    expected = []
+    for path in paths:
+        with open(path, 'rb') as file:
+            expected.append(file.read())
+
+    opened = []
+    rng = np.random.default_rng(0)
+    delays = rng.uniform(0, 0.005, len(paths))
+    def slow_open(path, mode='r'):
+        ### later files finish first now and then, the contents still have to come in order
+        time.sleep(delays[paths.index(path)])
+        opened.append(path)
+        return open(path, mode)
+    monkeypatch.setattr(tools, 'open', slow_open, raising=False)
+
+    assert list(tools.read_files(paths, threads=1)) == expected
+    for threads in [2, 4]:
+        opened.clear()
+        contents = []
+        for content in tools.read_files(paths, threads):
+            contents.append(content)
+            time.sleep(0.01)
+            ### at most 2 * threads files are read ahead of the caller
+            assert len(opened) <= len(contents) + 2 * threads
+        assert contents == expected
+        assert sorted(opened) == paths
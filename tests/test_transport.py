@@ -0,0 +1,41 @@
+import numpy as np
+import xarray as xr
+from WBTSdata import transport, ragged
+
+
+def uniform_section(n_casts=5, depth=100.0, v=0.5):
+    '''
+    Casts along 26.5N in the Abaco box with a uniform northward velocity.
+    '''
+    lon = np.linspace(-76.0, -75.0, n_casts)
+    levels = np.arange(0, depth + 1, 10.0)
+    ds = xr.Dataset(coords={'DATETIME': np.datetime64('2009-04-01') + np.arange(n_casts) * np.timedelta64(1, 'h'),
+                            'DEPTH': levels})
+    ds['LATITUDE'] = ('DATETIME', np.full(n_casts, 26.5))
+    ds['LONGITUDE'] = ('DATETIME', lon)
+    ds['GC_STRING'] = ('DATETIME', np.full(n_casts, 'GC_2009_04'))
+    ds['U_WATER_VELOCITY'] = (('DATETIME', 'DEPTH'), np.zeros((n_casts, len(levels))))
+    ds['V_WATER_VELOCITY'] = (('DATETIME', 'DEPTH'), np.full((n_casts, len(levels)), v))
+    return ds
+
+
+def test_uniform_velocity():
+    ds = uniform_section()
+    width = 1.0 * transport.m_per_deg_lon * np.cos(np.deg2rad(26.5))
+    table = transport.transport(ds)
+    assert list(table.columns) == transport.columns
+    assert table['section'].tolist() == ['Abaco']
+    assert table['n_casts'].tolist() == [5]
+    np.testing.assert_allclose(table['width'], width / 1e3)
+    np.testing.assert_allclose(table['transport'], 0.5 * 100.0 * width / 1e6)
+
+def test_ragged_dataset():
+    ds = uniform_section()
+    ds['V_WATER_VELOCITY'][0, 3:] = np.nan
+    padded = transport.transport(ds)
+    assert transport.transport(ragged.to_ragged(ds)).equals(padded)
+
+def test_no_files():
+    table = transport.transport_files([])
+    assert table.empty
+    assert list(table.columns) == transport.columns
@@ -0,0 +1,47 @@
+import warnings
+import numpy as np
+import pytest
+import xarray as xr
+from WBTSdata import merge_datasets, regrid, tools, zarr_store
+from benchmarks import synthetic
+
+warnings.filterwarnings('ignore')
+
+grid = np.arange(0, 200, 2.0)
+
+
+@pytest.fixture(scope='module')
+def cruises(tmp_path_factory):
+    return synthetic.write_archive(str(tmp_path_factory.mktemp('raw')), n_casts=4, n_levels=60,
+                                   cruises=['2009_04', '2018_11'])
+
+@pytest.fixture(scope='module')
+def config():
+    return tools.get_config()
+
+
+def test_regrid_merged_uses_depth_of_ctd_pressure(cruises, config):
+    _, cal_dir, vel_dir = cruises[0]
+    ds = regrid.regrid_merged(merge_datasets.merge_datasets(cal_dir, vel_dir, config), grid)
+    ds_grid = merge_datasets.merge_datasets(cal_dir, vel_dir, config, depth_grid=grid)
+    for var in ['PRES', 'TEMP', 'PSAL', 'U_WATER_VELOCITY', 'V_WATER_VELOCITY']:
+        xr.testing.assert_allclose(ds[var], ds_grid[var].transpose(*ds[var].dims))
+    ### the pressure in dbar is larger than the depth in m
+    pres = ds['PRES'].values
+    assert np.all(pres[~np.isnan(pres)] >= grid[np.nonzero(~np.isnan(pres))[1]])
+
+def test_append_cruises(cruises, config, tmp_path):
+    pytest.importorskip('zarr')
+    store = str(tmp_path / 'store.zarr')
+    merged = [merge_datasets.merge_datasets(cal_dir, vel_dir, config) for _, cal_dir, vel_dir in cruises]
+    assert zarr_store.append_cruise(merged[0], store, grid=grid)
+    assert zarr_store.append_cruise(merged[1], store)
+    ds_store = zarr_store.open_store(store).load()
+    np.testing.assert_array_equal(ds_store['DEPTH'].values, grid)
+    assert ds_store.sizes['DATETIME'] == sum(ds.sizes['DATETIME'] for ds in merged)
+    assert ds_store['TEMP'].notnull().any()
+
+def test_observations_outside_grid(cruises, config, tmp_path):
+    _, cal_dir, vel_dir = cruises[0]
+    with pytest.raises(ValueError, match='outside the DEPTH grid'):
+        zarr_store.on_depth_grid(merge_datasets.merge_datasets(cal_dir, vel_dir, config), grid[:20])